@@ -0,0 +1,55 @@
+"""比较 tomlkit 与只读快速路径解析大型全局包锁的耗时
+
+用法: python benchmarks/lock_parse.py [规则包数量]
+"""
+
+from pathlib import Path
+from ipm.models.lock import PackageLock
+from ipm.utils import toml
+
+import tempfile
+import tomlkit
+import timeit
+import sys
+
+
+def generate(path: Path, count: int) -> None:
+    lock = PackageLock(path)
+    with lock.transaction():
+        for i in range(count):
+            lock.add_frozen_package(
+                f"package-{i // 10}",
+                f"0.{i % 10}.0",
+                "0" * 64,
+                "https://yggdrasil.noctisynth.org/",
+                str(path.joinpath("storage", f"package-{i // 10}-0.{i % 10}.0.ipk")),
+            )
+
+
+def main(count: int = 5000, number: int = 5) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir)
+        generate(path, count)
+        lock_path = path.joinpath("infini.lock")
+        size = lock_path.stat().st_size
+
+        backend = "tomlkit" if toml.tomllib is None else toml.tomllib.__name__
+        results = {
+            "tomlkit": timeit.timeit(
+                lambda: tomlkit.loads(lock_path.read_text(encoding="utf-8")),
+                number=number,
+            ),
+            backend: timeit.timeit(lambda: toml.load(lock_path), number=number),
+            "PackageLock": timeit.timeit(
+                lambda: PackageLock(path).has_frozen_package("package-0", "0.0.0"),
+                number=number,
+            ),
+        }
+
+    print(f"infini.lock: {count} 个规则包, {size / 1024:.1f} KiB")
+    for name, elapsed in results.items():
+        print(f"{name:>12}: {elapsed / number * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -1,5 +1,6 @@
 from pathlib import Path
 from ipm import api
+from ipm.const import DOWNLOAD_WORKERS
 from ipm.exceptions import IPMException
 from ipm.logging import status, error, tada
 
@@ -11,10 +12,12 @@ main = typer.Typer(
 
 
 @main.command()
-def lock():
+def lock(
+    offline: bool = typer.Option(False, "--offline", help="离线模式, 仅使用本地缓存")
+):
     """从项目文件构建锁文件"""
     try:
-        if api.lock(".", echo=True):
+        if api.lock(".", offline=offline, echo=True):
             tada()
     except IPMException as err:
         error(str(err), echo=True)
@@ -134,9 +137,68 @@ def yggdrasil_remove(
         status.stop()
 
 
+@yggdrasil.command("ttl")
+def yggdrasil_ttl(
+    name: str = typer.Argument(help="世界树名称"),
+    ttl: int = typer.Argument(help="本地索引有效期 (秒)"),
+):
+    """设置世界树本地索引的有效期"""
+    try:
+        if api.yggdrasil_ttl(Path.cwd(), name, ttl, echo=True):
+            tada()
+    except IPMException as err:
+        error(str(err), echo=True)
+    finally:
+        status.stop()
+
+
+@yggdrasil.command("mirror")
+def yggdrasil_mirror(
+    name: str = typer.Argument(help="世界树名称"),
+    dist: str = typer.Argument(help="快照目录"),
+    fetch: bool = typer.Option(False, "--fetch", help="下载本地缺失的发行包"),
+):
+    """将世界树索引与本地发行包快照到目录"""
+    try:
+        if api.yggdrasil_mirror(Path.cwd(), name, dist, fetch=fetch, echo=True):
+            tada()
+    except IPMException as err:
+        error(str(err), echo=True)
+    finally:
+        status.stop()
+
+
+@yggdrasil.command("serve")
+def yggdrasil_serve(
+    dist: str = typer.Argument(help="快照目录"),
+    host: str = typer.Option("0.0.0.0", help="监听地址"),
+    port: int = typer.Option(8000, help="监听端口"),
+):
+    """以 HTTP 服务世界树快照"""
+    try:
+        api.yggdrasil_serve(dist, host, port, echo=True)
+    except IPMException as err:
+        error(str(err), echo=True)
+    finally:
+        status.stop()
+
+
+@main.command()
+def search(query: str = typer.Argument(help="检索关键词")):
+    """在世界树中检索规则包"""
+    try:
+        api.search(query, echo=True)
+    except IPMException as err:
+        error(str(err), echo=True)
+    finally:
+        status.stop()
+
+
 @main.command()
 def require(
-    name: str = typer.Argument(help="Infini 包名"),
+    name: str = typer.Argument(
+        help="Infini 包名, 可附带版本约束, 如 dice>=0.1.0,<0.3.0"
+    ),
     path: str = typer.Option(None, help="Infini 包本地路径"),
     yggdrasil: str = typer.Option(None, help="世界树服务器名称"),
     index: str = typer.Option(None, help="世界树服务器地址"),
@@ -211,10 +273,15 @@ def doc(
 
 
 @main.command()
-def sync():
+def sync(
+    offline: bool = typer.Option(False, "--offline", help="离线模式, 仅使用本地缓存"),
+    jobs: int = typer.Option(
+        DOWNLOAD_WORKERS, "--jobs", "-j", min=1, help="并行下载规则包的线程数"
+    ),
+):
     """同步依赖环境"""
     try:
-        if api.sync(Path.cwd(), echo=True):
+        if api.sync(Path.cwd(), offline=offline, jobs=jobs, echo=True):
             tada()
     except IPMException as err:
         error(str(err), echo=True)
@@ -223,10 +290,15 @@ def sync():
 
 
 @main.command()
-def install():
+def install(
+    offline: bool = typer.Option(False, "--offline", help="离线模式, 仅使用本地缓存"),
+    jobs: int = typer.Option(
+        DOWNLOAD_WORKERS, "--jobs", "-j", min=1, help="并行下载规则包的线程数"
+    ),
+):
     """安装规则包环境"""
     try:
-        if api.install(Path.cwd(), echo=True):
+        if api.install(Path.cwd(), offline=offline, jobs=jobs, echo=True):
             tada()
     except IPMException as err:
         error(str(err), echo=True)
@@ -235,10 +307,12 @@ def install():
 
 
 @main.command()
-def update():
+def update(
+    offline: bool = typer.Option(False, "--offline", help="离线模式, 仅使用本地缓存")
+):
     """更新规则包依赖"""
     try:
-        if api.update(Path.cwd(), echo=True):
+        if api.update(Path.cwd(), offline=offline, echo=True):
             tada()
     except IPMException as err:
         error(str(err), echo=True)
@@ -1,10 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from distlib.version import SemanticVersion
-from typing import Optional
+from typing import Optional, Tuple
 
-from ipm.const import INDEX, VUE_CODE
-from ipm.models.lock import PackageLock, ProjectLock
+from ipm.const import DOWNLOAD_WORKERS, INDEX, SYNC_WORKERS, VUE_CODE
+from ipm.models.lock import LockedPackage, PackageLock, ProjectLock
 from ipm.project.env import new_virtualenv
 from ipm.project.toml_file import (
     add_yggdrasil,
@@ -13,8 +13,9 @@ from ipm.project.toml_file import (
     remove_yggdrasil,
 )
 from ipm.typing import StrPath
-from ipm.utils import freeze, loader
+from ipm.utils import freeze, http, loader, mirror, resolve
 from ipm.utils.git import get_user_name_email, git_init, git_tag
+from ipm.utils.version import SpecifierSet, Version
 from ipm.logging import confirm, status, statusup, info, success, warning, error, ask
 from ipm.exceptions import (
     EnvironmentError,
@@ -24,8 +25,8 @@ from ipm.exceptions import (
     NameError,
     RuntimeError,
 )
-from ipm.models.ipk import InfiniProject
-from ipm.models.index import Yggdrasil
+from ipm.models.ipk import InfiniFrozenPackage, InfiniProject
+from ipm.models.index import PACKAGES_FILE, Yggdrasil
 
 from infini.loader import Loader
 
@@ -36,9 +37,10 @@ import importlib
 import subprocess
 import tomlkit
 import json
+import time
 
 
-def lock(target_path: StrPath, echo: bool = False) -> bool:
+def lock(target_path: StrPath, offline: bool = False, echo: bool = False) -> bool:
     info("生成项目锁...", echo)
 
     statusup("检查环境中...", echo)
@@ -49,14 +51,21 @@ def lock(target_path: StrPath, echo: bool = False) -> bool:
     project = InfiniProject(toml_path.parent)
     success("环境检查完毕.", echo)
 
+    if ProjectLock(target_path).up_to_date(project):
+        success("项目依赖锁已是最新, 跳过依赖解析.", echo)
+        return True
+
     statusup("写入依赖锁文件...", echo)
-    lock = ProjectLock.init_from_project(project)
+    with http.offline_mode(offline):
+        lock = ProjectLock.init_from_project(project)
     lock.dump()
+    for cycle in lock.graph.cycles():
+        warning(f"检测到循环依赖: {' -> '.join([*cycle, cycle[0]])}.", echo)
     success("项目依赖锁写入完成.", echo)
     return True
 
 
-def check(target_path: StrPath, echo: bool = False) -> bool:
+def check(target_path: StrPath, offline: bool = False, echo: bool = False) -> bool:
     info("检查项目环境...", echo)
     statusup("检查基础环境中...", echo)
     if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
@@ -67,16 +76,56 @@ def check(target_path: StrPath, echo: bool = False) -> bool:
     success("环境检查完毕.", echo)
 
     statusup("同步世界树中...", echo)
-    global_lock = PackageLock()
-    for index in project.yggdrasils.values():
-        statusup(f"同步世界树: [green]{index}[/green]...", echo)
-        if not (yggdrasil := global_lock.get_yggdrasil_by_index(index)):
-            Yggdrasil.init(index)
+    global_lock = PackageLock.load()
+
+    def sync_yggdrasil(
+        index: str, yggdrasil: Optional[Yggdrasil]
+    ) -> Tuple[Yggdrasil, float]:
+        start = time.perf_counter()
+        if not yggdrasil:
+            yggdrasil = Yggdrasil.init(index, register=False)
         else:
-            yggdrasil.sync()
-        success(f"世界树 [green]{index}[/green] 同步完毕.", echo)
-
-    if not lock(target_path, echo=echo):
+            yggdrasil.sync(register=False)
+        return yggdrasil, time.perf_counter() - start
+
+    indexes = list(dict.fromkeys(project.yggdrasils.values()))
+    # 有效期内的本地索引只读取 sync.json, 不解析索引
+    stale = []
+    for index in indexes:
+        uuid = global_lock.get_uuid_by_index(index)
+        if uuid and (offline or Yggdrasil.is_fresh(uuid)):
+            success(f"世界树 [green]{index}[/green] 使用本地缓存.", echo)
+        else:
+            stale.append(index)
+    # 在主线程中查找本地索引, 工作线程不访问全局包锁
+    yggdrasils = {index: global_lock.get_yggdrasil_by_index(index) for index in stale}
+    results = []
+    if yggdrasils:
+        statusup(f"同步世界树: {', '.join(stale)}...", echo)
+        with http.offline_mode(offline), ThreadPoolExecutor(
+            max_workers=min(SYNC_WORKERS, len(yggdrasils))
+        ) as executor:
+            futures = {
+                executor.submit(sync_yggdrasil, index, yggdrasil): index
+                for index, yggdrasil in yggdrasils.items()
+            }
+            for future in as_completed(futures):
+                yggdrasil, elapsed = future.result()
+                results.append((futures[future], yggdrasil))
+                success(
+                    f"世界树 [green]{futures[future]}[/green] 同步完毕 ({elapsed:.2f}s).",
+                    echo,
+                )
+
+    # 同步期间不持有全局包锁, 全部完成后一次性登记
+    if results:
+        with global_lock.transaction():
+            for index, yggdrasil in results:
+                global_lock.update_index(
+                    index, yggdrasil.uuid, str(yggdrasil._source_path)
+                )
+
+    if not lock(target_path, offline=offline, echo=echo):
         return False
 
     return True
@@ -281,6 +330,90 @@ def yggdrasil_add(
     return True
 
 
+def yggdrasil_ttl(
+    target_path: StrPath, name: str, ttl: int, echo: bool = False
+) -> bool:
+    info(f"设置世界树有效期: [bold green]{name}[/bold green]", echo)
+    statusup("检查环境中...", echo)
+    if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
+        raise FileNotFoundError(
+            f"文件 [green]infini.toml[/green] 尚未被初始化, 你可以使用[bold green]`ipm init`[/bold green]来初始化项目."
+        )
+    project = InfiniProject(toml_path.parent)
+    if name not in project.yggdrasils:
+        raise ProjectError(f"世界树 [bold red]{name}[/bold red] 未注册, 忽略操作.")
+    success("环境检查完毕.", echo)
+
+    statusup("同步世界树中...", echo)
+    index = project.yggdrasils[name]
+    yggdrasil = PackageLock.load().get_yggdrasil_by_index(index) or Yggdrasil.init(
+        index
+    )
+    yggdrasil.ttl = ttl
+    success(f"世界树 [green]{index}[/green] 有效期已设置为 {ttl} 秒.", echo)
+    return True
+
+
+def yggdrasil_mirror(
+    target_path: StrPath,
+    name: str,
+    dist: StrPath,
+    fetch: bool = False,
+    echo: bool = False,
+) -> bool:
+    info(f"快照世界树: [bold green]{name}[/bold green]", echo)
+    statusup("检查环境中...", echo)
+    if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
+        raise FileNotFoundError(
+            f"文件 [green]infini.toml[/green] 尚未被初始化, 你可以使用[bold green]`ipm init`[/bold green]来初始化项目."
+        )
+    project = InfiniProject(toml_path.parent)
+    if name not in project.yggdrasils:
+        raise ProjectError(f"世界树 [bold red]{name}[/bold red] 未注册, 忽略操作.")
+    success("环境检查完毕.", echo)
+
+    statusup("同步世界树中...", echo)
+    index = project.yggdrasils[name]
+    if not (yggdrasil := PackageLock.load().get_yggdrasil_by_index(index)):
+        yggdrasil = Yggdrasil.init(index)
+    elif not yggdrasil.fresh:
+        yggdrasil.sync()
+    success(f"世界树 [green]{index}[/green] 同步完成.", echo)
+
+    statusup("生成世界树快照中...", echo)
+    dist = Path(dist).resolve()
+    result = mirror.snapshot(yggdrasil, dist, fetch=fetch)
+    success(
+        f"已快照 {result.packages} 个规则包与 {result.distributions} 个发行包至 [green]{dist}[/green].",
+        echo,
+    )
+    if result.missing:
+        warning(
+            f"{result.missing} 个发行包在本地不存在, 镜像中将无法下载"
+            + ("." if fetch else ", 你可以使用[bold green]`--fetch`[/bold green]下载."),
+            echo,
+        )
+    return True
+
+
+def yggdrasil_serve(
+    dist: StrPath, host: str = "0.0.0.0", port: int = 8000, echo: bool = False
+) -> bool:
+    dist = Path(dist).resolve()
+    if not dist.joinpath("json", PACKAGES_FILE).exists():
+        raise FileNotFoundError(
+            f"目录 [red]{dist}[/red] 不是世界树快照, 请先执行[bold green]`ipm yggdrasil mirror`[/bold green]."
+        )
+    statusup("启动世界树镜像...", echo)
+    info(
+        f"世界树镜像运行于 [bold green]http://{host}:{port}/[/bold green], 按 Ctrl+C 退出.",
+        echo,
+    )
+    status.stop()
+    mirror.serve(dist, host, port)
+    return True
+
+
 def yggdrasil_remove(target_path: StrPath, name: str, echo: bool = False) -> bool:
     info(f"新增世界树: [bold green]{name}[/bold green]", echo)
     statusup("检查环境中...", echo)
@@ -295,6 +428,23 @@ def yggdrasil_remove(target_path: StrPath, name: str, echo: bool = False) -> boo
     return True
 
 
+def search(query: str, echo: bool = False) -> bool:
+    info(f"检索规则包: [bold green]{query}[/bold green]", echo)
+    statusup("检索世界树中...", echo)
+    found = False
+    for yggdrasil in PackageLock.load().get_all_indexes():
+        for name, document in yggdrasil.search(query):
+            found = True
+            info(
+                f"[bold green]{name}[/bold green] [yellow]{document['version']}[/yellow]"
+                f" [dim]({yggdrasil.index})[/dim]\n    {document['description']}",
+                echo,
+            )
+    if not found:
+        warning(f"未能找到匹配 [red]{query}[/red] 的规则包.", echo)
+    return found
+
+
 def require(
     target_path: StrPath,
     name: str,
@@ -311,7 +461,7 @@ def require(
             f"文件 [green]infini.toml[/green] 尚未被初始化, 你可以使用[bold green]`ipm init`[/bold green]来初始化项目."
         )
     project = InfiniProject(toml_path.parent)
-    global_lock = PackageLock()
+    global_lock = PackageLock.load()
     success("环境检查完毕.", echo)
 
     statusup("检查世界树中...", echo)
@@ -323,13 +473,22 @@ def require(
     if not ygd:
         raise ProjectError("世界树检查失败！")
 
-    splited_name = name.split("==")  # TODO 支持 >= <= > < 标识
-    name = splited_name[0]
+    if not (match := re.match(r"^\s*([\w.-]+)\s*(.*?)\s*$", name)):
+        raise NameError(f"无效的规则包依赖: [red]{name}[/red].")
+    name, constraint = match.groups()
 
-    if len(splited_name) > 1:
-        version = splited_name[1]
-    else:
+    if not constraint:
         version = ygd.get_lastest_version(name)
+    else:
+        try:
+            specifier = SpecifierSet(constraint)
+        except ValueError as e:
+            raise NameError(str(e)) from e
+        version = (
+            (specifier.exact or constraint)
+            if specifier.best(ygd.get_distributions(name))
+            else None
+        )
 
     if not version:
         raise ProjectError(f"无法找到一个匹配 [red]{name}[/red] 的版本。")
@@ -344,6 +503,8 @@ def require(
         yggdrasil=yggdrasil,
         index=index,
     )
+    # 确认新的依赖可以被解析后再写入项目文件
+    resolve.Resolver().resolve(resolve.get_terms_by_project(project))
     project.dump()
     success("项目文件写入完成.", echo)
 
@@ -437,7 +598,12 @@ def remove(target_path: StrPath, name: str, echo: bool = False):
     return True
 
 
-def sync(target_path: StrPath, echo: bool = False) -> bool:
+def sync(
+    target_path: StrPath,
+    offline: bool = False,
+    jobs: int = DOWNLOAD_WORKERS,
+    echo: bool = False,
+) -> bool:
     info(f"同步依赖环境...", echo)
     statusup("检查环境中...", echo)
     if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
@@ -450,7 +616,7 @@ def sync(target_path: StrPath, echo: bool = False) -> bool:
         raise FileNotFoundError(
             "文件[red]infini.lock[/red]不存在！请先执行[bold red]`.ipm lock`[/bold red]生成锁文件！"
         )
-    global_lock = PackageLock()
+    global_lock = PackageLock.load()
     if not shutil.which("pdm"):
         raise EnvironmentError(
             "IPM 未能在环境中找到 [bold green]PDM[/bold green] 安装, 请确保 PDM 在环境中被正确安装. "
@@ -459,30 +625,57 @@ def sync(target_path: StrPath, echo: bool = False) -> bool:
     success("环境检查完毕.", echo)
 
     statusup("同步依赖环境中...", echo)
-    for requirement in lock.requirements:
-        if not requirement.is_local():
-            if global_lock.has_frozen_package(requirement.name, requirement.version):
-                continue
-            statusup(
-                f"下载 [bold green]{requirement.name}[/bold green] [bold yellow]{requirement.version}[/bold yellow]...",
-                echo,
-            )
-            ifp = loader.load_from_remote(
-                requirement.name,
-                requirement.yggdrasil.index.rstrip("/") + (requirement.url or ""),
-                requirement.hash or "",
-            )
+    missing = [
+        package
+        for package in lock.packages
+        if not package.is_local()
+        and not global_lock.find_frozen_package(
+            package.name, package.version, package.hash
+        )
+    ]
+
+    def fetch(package: LockedPackage) -> InfiniFrozenPackage:
+        return loader.load_from_storage(
+            package.name, package.version, package.hash or ""
+        ) or loader.load_from_remote(
+            package.name, package.download_url, package.hash or "", package.version
+        )
+
+    downloaded, errors = [], []
+    if missing:
+        statusup(f"下载规则包中 (0/{len(missing)})...", echo)
+        with http.offline_mode(offline), ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(missing)))
+        ) as executor:
+            futures = {executor.submit(fetch, package): package for package in missing}
+            for done, future in enumerate(as_completed(futures), 1):
+                package = futures[future]
+                try:
+                    downloaded.append((package, future.result()))
+                except Exception as err:
+                    errors.append(err)
+                    error(
+                        f"[bold red]{package.name} {package.version}[/] 下载失败.", echo
+                    )
+                else:
+                    success(
+                        f"[bold green]{package.name} {package.version}[/bold green] 下载完成！",
+                        echo,
+                    )
+                statusup(f"下载规则包中 ({done}/{len(missing)})...", echo)
+
+    # 全部下载结束后一次性写入全局包锁
+    with global_lock.transaction():
+        for package, ifp in downloaded:
             global_lock.add_frozen_package(
-                requirement.name,
-                requirement.version,
-                requirement.hash or "",
-                requirement.yggdrasil.index,
+                package.name,
+                package.version,
+                package.hash or "",
+                package.yggdrasil or "",
                 str(ifp._source_path),
             )
-            success(
-                f"[bold green]{requirement.name} {requirement.version}[/bold green] 安装完成！",
-                echo,
-            )
+    if errors:
+        raise errors[0]
     statusup("同步依赖环境中...", echo)
     dependencies = []
     for name, version in project.dependencies.items():
@@ -490,7 +683,9 @@ def sync(target_path: StrPath, echo: bool = False) -> bool:
             dependencies.append(name)
         else:
             dependencies.append(f"{name}{version}")
-    if dependencies:
+    if dependencies and offline:
+        warning("离线模式下跳过 Python 依赖安装.", echo)
+    elif dependencies:
         statusup(
             "安装依赖: "
             + ", ".join(
@@ -517,7 +712,12 @@ def sync(target_path: StrPath, echo: bool = False) -> bool:
     return True
 
 
-def install(target_path: StrPath, echo: bool = False) -> bool:
+def install(
+    target_path: StrPath,
+    offline: bool = False,
+    jobs: int = DOWNLOAD_WORKERS,
+    echo: bool = False,
+) -> bool:
     info("安装规则包环境中...", echo)
     statusup("检查环境中...", echo)
     if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
@@ -525,7 +725,7 @@ def install(target_path: StrPath, echo: bool = False) -> bool:
             f"文件 [green]infini.toml[/green] 尚未被初始化, 你可以使用[bold green]`ipm init`[/bold green]来初始化项目."
         )
     project = InfiniProject(toml_path.parent)
-    global_lock = PackageLock()
+    global_lock = PackageLock.load()
     if not shutil.which("pdm"):
         raise EnvironmentError(
             "IPM 未能在环境中找到 [bold green]PDM[/bold green] 安装, 请确保 PDM 在环境中被正确安装. "
@@ -533,29 +733,30 @@ def install(target_path: StrPath, echo: bool = False) -> bool:
         )
     success("环境检查完毕.", echo)
 
-    check(target_path, echo)
-    sync(target_path, echo)
+    check(target_path, offline=offline, echo=echo)
+    sync(target_path, offline=offline, jobs=jobs, echo=echo)
 
     statusup("安装依赖中...", echo)
     lock = ProjectLock(target_path)
     packages_path = toml_path.parent.joinpath("packages")
     packages_path.mkdir(parents=True, exist_ok=True)
-    ProjectLock.init_from_project(project, packages_path)
-    for requirement in lock.requirements:
+    graph = lock.graph
+    for name in graph.order():
+        package = graph.nodes[name]
         try:
-            prj = InfiniProject(packages_path.joinpath(requirement.name))
-            if prj.version >= requirement.version:
+            prj = InfiniProject(packages_path.joinpath(package.name))
+            if Version(prj.version) >= Version(package.version):
                 continue
         except:
             pass
-        path = global_lock.get_frozen_package_path(
-            requirement.name, requirement.version
+        path = global_lock.find_frozen_package(
+            package.name, package.version, package.hash
         )
         if not path:
             raise ProjectError(
-                f"无法找到依赖 [red]{requirement.name} {requirement.version}[/red]."
+                f"无法找到依赖 [red]{package.name} {package.version}[/red]."
             )
-        prj = freeze.extract_ipk(path, packages_path, hash=requirement.hash)
+        prj = freeze.extract_ipk(path, packages_path, hash=package.hash)
         shutil.move(
             str(prj._source_path), str(prj._source_path.parent.joinpath(prj.name))
         )
@@ -610,7 +811,7 @@ def doc(
     return True
 
 
-def update(target_path: StrPath, echo: bool = False) -> bool:
+def update(target_path: StrPath, offline: bool = False, echo: bool = False) -> bool:
     info("更新依赖环境...", echo)
     statusup("检查环境中...", echo)
     if not (toml_path := Path(target_path).joinpath("infini.toml")).exists():
@@ -626,19 +827,43 @@ def update(target_path: StrPath, echo: bool = False) -> bool:
     success("环境检查完毕.", echo)
 
     statusup("更新依赖中...", echo)
-    for requirement in project.requirements:
-        lastest_version = requirement.yggdrasil.get_lastest_version(requirement.name)
-        if not lastest_version:
-            raise ProjectError(f"包 [bold red]{requirement.name}[/bold red] 被从世界树燃烧了。")
-        if SemanticVersion(lastest_version) > SemanticVersion(requirement.version):
-            project.require(requirement.name, version=lastest_version)
-            success(
-                f"将 [bold green]{requirement.version}[/bold green] 升级到 [bold yellow]{lastest_version}[/bold yellow].",
-                echo,
-            )
-
-    check(target_path, echo)
-    sync(target_path, echo)
-
-    install(target_path, echo)
+    updated = False
+    # 稀疏索引查询最新版本时可能访问世界树, 整个更新过程都须遵循离线模式
+    with http.offline_mode(offline):
+        for term in resolve.get_terms_by_project(project):
+            # 版本范围约束在重新生成项目锁时自动选择最新的匹配版本
+            if (
+                term.path
+                or term.url
+                or not (version := SpecifierSet(term.constraint).exact)
+            ):
+                continue
+            lastest_version = term.yggdrasil.get_lastest_version(term.name)
+            if not lastest_version:
+                raise ProjectError(
+                    f"包 [bold red]{term.name}[/bold red] 被从世界树燃烧了。"
+                )
+            if Version(lastest_version) > Version(version):
+                # 保留依赖原有的世界树设置
+                requirement = project.data["requirements"][term.name]
+                if isinstance(requirement, str):
+                    requirement = {}
+                project.require(
+                    term.name,
+                    version=lastest_version,
+                    yggdrasil=requirement.get("yggdrasil"),
+                    index=requirement.get("index"),
+                )
+                updated = True
+                success(
+                    f"将 [bold green]{version}[/bold green] 升级到 [bold yellow]{lastest_version}[/bold yellow].",
+                    echo,
+                )
+    if updated:
+        project.dump()
+
+    check(target_path, offline=offline, echo=echo)
+    sync(target_path, offline=offline, echo=echo)
+
+    install(target_path, offline=offline, echo=echo)
     return True
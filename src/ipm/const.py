@@ -10,6 +10,18 @@ IPM_PATH = Path.home() / ".ipm"
 SRC_HOME = IPM_PATH / "src"
 STORAGE = IPM_PATH / "storage"
 INDEX_PATH = IPM_PATH / "index"
+INDEX_TTL = 5 * 60  # 世界树索引的默认有效期 (秒), 有效期内不再访问世界树
+SPARSE_TTL = 10 * 60  # 稀疏索引中规则包缓存的有效期 (秒)
+INDEX_BACKEND = "json"  # 本地索引存储方式: json 或 sqlite
+INDEX_COMPRESSION = "gz"  # 本地索引的压缩格式: gz, xz, zst 或留空不压缩
+SYNC_WORKERS = 4  # 并行同步世界树的最大线程数
+DOWNLOAD_WORKERS = 4  # 并行下载规则包的默认线程数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 流式下载规则包时每次写入的字节数
+HTTP_POOL_SIZE = 16  # 每个主机保持的最大连接数, 应不小于并行线程数
+HTTP_RETRIES = 3  # 建立连接失败时的重试次数
+HTTP_TIMEOUT = (10, 60)  # 连接与读取的超时时间 (秒)
+RESOLVE_CACHE_PATH = IPM_PATH / "cache" / "resolve"
+RESOLVE_CACHE_SIZE = 16 * 1024 * 1024  # 依赖解析缓存的大小上限 (字节), 超出时淘汰最久未用的结果
 
 # 文本参数
 ATTENTIONS = (
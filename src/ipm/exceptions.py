@@ -56,3 +56,11 @@ class RuntimeError(IPMException, RuntimeError):
 
 class NameError(IPMException):
     """Provided name is not valid"""
+
+
+class OfflineError(IPMException):
+    """Network access is required in offline mode"""
+
+
+class ResolutionError(IPMException):
+    """Failed to resolve requirements"""
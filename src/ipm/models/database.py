@@ -0,0 +1,193 @@
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from ipm.typing import Dict
+
+import sqlite3
+import json
+
+DATABASE_FILE = "index.db"
+MAX_VARIABLES = 900  # 单条查询的参数个数上限, 低于 SQLite 的默认限制 999
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    latest_version TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS distributions (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    url TEXT NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (package, version)
+);
+CREATE TABLE IF NOT EXISTS requirements (
+    package TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    package TEXT NOT NULL,
+    topic TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requirements_package ON requirements (package);
+CREATE INDEX IF NOT EXISTS topics_package ON topics (package);
+CREATE INDEX IF NOT EXISTS topics_topic ON topics (topic);
+"""
+
+
+class IndexDatabase:
+    """SQLite 格式的本地世界树索引
+
+    写入均在单个事务中完成, 多个 IPM 进程可以安全地共享同一个索引.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """数据库连接, 关闭后再次访问时重新连接"""
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                str(self._path), timeout=30, check_same_thread=False
+            )
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            key: json.loads(value)
+            for key, value in self.connection.execute("SELECT key, value FROM metadata")
+        }
+
+    def ingest(self, packages: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """以完整索引的规则包覆盖数据库, `packages` 可以是流式解析的迭代器"""
+        with self.connection:
+            for table in (
+                "metadata",
+                "packages",
+                "distributions",
+                "requirements",
+                "topics",
+            ):
+                self.connection.execute(f"DELETE FROM {table}")
+            for name, package in packages:
+                self._insert(name, package)
+
+    def update_metadata(self, metadata: Dict[str, Any]) -> None:
+        with self.connection:
+            self._update_metadata(metadata)
+
+    def patch(
+        self,
+        metadata: Dict[str, Any],
+        packages: Dict[str, Any],
+        removed: Iterable[str],
+    ) -> None:
+        """应用增量索引"""
+        with self.connection:
+            for name in (*packages, *removed):
+                self._delete(name)
+            for name, package in packages.items():
+                self._insert(name, package)
+            self._update_metadata(metadata)
+
+    def _delete(self, name: str) -> None:
+        for table, column in (
+            ("packages", "name"),
+            ("distributions", "package"),
+            ("requirements", "package"),
+            ("topics", "package"),
+        ):
+            self.connection.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+
+    def _update_metadata(self, metadata: Dict[str, Any]) -> None:
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in metadata.items()],
+        )
+
+    def _insert(self, name: str, package: Dict[str, Any]) -> None:
+        self.connection.execute(
+            "INSERT INTO packages VALUES (?, ?, ?, ?)",
+            (
+                name,
+                package.get("description"),
+                package.get("latestVersion"),
+                json.dumps(package, ensure_ascii=False),
+            ),
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO distributions VALUES (?, ?, ?, ?)",
+            [
+                (
+                    name,
+                    distribution["version"],
+                    distribution["download_url"],
+                    distribution.get("hash"),
+                )
+                for distribution in package.get("distributions", [])
+            ],
+        )
+        self.connection.executemany(
+            "INSERT INTO requirements VALUES (?, ?, ?)",
+            [
+                (name, requirement["name"], requirement.get("version"))
+                for requirement in package.get("requirements", [])
+            ],
+        )
+        self.connection.executemany(
+            "INSERT INTO topics VALUES (?, ?)",
+            [(name, topic) for topic in package.get("topics", [])],
+        )
+
+    def get_package(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            "SELECT data FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_packages(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for name, data in self.connection.execute(
+            "SELECT name, data FROM packages ORDER BY name"
+        ):
+            yield name, json.loads(data)
+
+    def get_lastest_version(self, name: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT latest_version FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def lookup_distributions(
+        self, names: List[str]
+    ) -> Dict[str, List[Tuple[str, str, Optional[str]]]]:
+        """批量查询多个规则包的发行版"""
+        res: Dict[str, List[Tuple[str, str, Optional[str]]]] = {}
+        for i in range(0, len(names), MAX_VARIABLES):
+            chunk = names[i : i + MAX_VARIABLES]
+            for package, version, url, hash in self.connection.execute(
+                "SELECT package, version, url, hash FROM distributions"
+                f" WHERE package IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ):
+                res.setdefault(package, []).append((version, url, hash))
+        return res
+
+    def get_distributions(self, name: str) -> List[Tuple[str, str, Optional[str]]]:
+        return self.connection.execute(
+            "SELECT version, url, hash FROM distributions WHERE package = ?", (name,)
+        ).fetchall()
@@ -1,34 +1,226 @@
 from pathlib import Path
-from typing import Any, List, Literal, Optional, Union, TYPE_CHECKING
-from ipm.const import INDEX_PATH
+from typing import (
+    IO,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from ipm.const import (
+    INDEX_BACKEND,
+    INDEX_COMPRESSION,
+    INDEX_PATH,
+    INDEX_TTL,
+    SPARSE_TTL,
+)
 from ipm.exceptions import LockLoadFailed
+from ipm.models.database import DATABASE_FILE, IndexDatabase
+from ipm.models.search import SEARCH_FILE, SearchIndex, SearchWriter
 from ipm.typing import Dict
+from ipm.utils import compress, fs, http, jsonstream
+from ipm.utils.fs import FileLock
+from ipm.utils.registry import FileRegistry, stamp
+from ipm.utils.version import Version
 
+import itertools
 import requests
-import tempfile
-import shutil
 import json
+import time
+import os
 
-if TYPE_CHECKING:
-    from ipm.models.requirement import Requirement
+
+class Distribution(NamedTuple):
+    """规则包发行版的紧凑记录"""
+
+    version: str
+    url: str
+    hash: Optional[str]
+
+
+PACKAGES_FILE = "packages.json"
+SYNC_FILE = "sync.json"
+SPARSE_FILE = "metadata.json"
+DELTA_IM = "yggdrasil-delta"
 
 
 class Yggdrasil:
+    _registry: FileRegistry["Yggdrasil"] = FileRegistry(
+        dispose=lambda yggdrasil: yggdrasil.close()
+    )
+
     def __init__(self, index: str, uuid: str) -> None:
         self.index = index.rstrip("/") + "/"
         self._source_path = INDEX_PATH.joinpath(uuid)
-        self._data = self.read()
+        self._document: Optional[Dict] = None
+        self._metadata = self.read()
+        self._distributions: Dict[str, Dict[str, Distribution]] = {}
+
+    @classmethod
+    def load(cls, index: str, uuid: str) -> "Yggdrasil":
+        """获取进程内共享的世界树, 本地索引未变化时不会重复解析"""
+        source_path = INDEX_PATH.joinpath(uuid)
+        return cls._registry.get(
+            (index.rstrip("/") + "/", source_path),
+            Yggdrasil.index_files(source_path),
+            lambda: cls(index, uuid),
+        )
+
+    def close(self) -> None:
+        """关闭本地索引数据库的连接, 之后查询时会重新连接"""
+        if getattr(self, "_database", None):
+            self._database.close()  # type: ignore
+
+    @staticmethod
+    def index_files(source_path: Path) -> Tuple[Path, ...]:
+        return (
+            source_path.joinpath(PACKAGES_FILE),
+            *(
+                source_path.joinpath(compress.filename(PACKAGES_FILE, compression))
+                for compression in compress.CODECS
+            ),
+            source_path.joinpath(SPARSE_FILE),
+            source_path.joinpath(DATABASE_FILE),
+        )
+
+    @staticmethod
+    def compression() -> Optional[str]:
+        """本地缓存索引的压缩格式, 不支持的格式视为不压缩"""
+        return INDEX_COMPRESSION if INDEX_COMPRESSION in compress.CODECS else None
+
+    @staticmethod
+    def packages_file() -> str:
+        return compress.filename(PACKAGES_FILE, Yggdrasil.compression())
 
     def read(self) -> Dict:
+        """读取世界树元数据, JSON 格式的完整索引在首次访问规则包时才解析"""
+        self.close()
+        self._database: Optional[IndexDatabase] = None
+        self._document = {}
+        self._stamp = stamp(*Yggdrasil.index_files(self._source_path))
         if not self._source_path.exists():
             self._source_path.parent.mkdir(parents=True, exist_ok=True)
             return {}
-        return json.load(
-            self._source_path.joinpath("packages.json").open("r", encoding="utf-8")
-        )
+        if self._source_path.joinpath(SPARSE_FILE).exists():
+            metadata = json.load(
+                self._source_path.joinpath(SPARSE_FILE).open("r", encoding="utf-8")
+            )
+        elif (database_path := self._source_path.joinpath(DATABASE_FILE)).exists():
+            self._database = IndexDatabase(database_path)
+            metadata = self._database.metadata
+        elif path := self.packages_path():
+            self._document = None
+            return Yggdrasil.read_metadata(path)
+        else:
+            return {}
+        self._document = {"metadata": metadata, "packages": {}}
+        return metadata
+
+    def packages_path(self) -> Optional[Path]:
+        """本地缓存的 JSON 格式完整索引"""
+        for path in Yggdrasil.index_files(self._source_path):
+            if path.name.startswith(PACKAGES_FILE) and path.exists():
+                return path
+        return None
+
+    @staticmethod
+    def iter_file(path: Path) -> Iterator[Tuple[Optional[str], str, Any]]:
+        """流式读取本地完整索引"""
+        with compress.open_file(path) as file:
+            yield from jsonstream.iter_items(
+                iter(lambda: file.read(jsonstream.CHUNK_SIZE), b""),
+                nested=("packages",),
+            )
+
+    @staticmethod
+    def read_metadata(path: Path) -> Dict:
+        """只读取完整索引中的元数据, 元数据位于规则包之前时无需读完整个文件"""
+        for parent, key, value in Yggdrasil.iter_file(path):
+            if parent is None and key == "metadata":
+                return value
+        return {}
+
+    @property
+    def _data(self) -> Dict:
+        """完整索引, 首次访问时才解析"""
+        if self._document is None:
+            self._document = {"packages": {}}
+            if path := self.packages_path():
+                self._document = Yggdrasil.parse(Yggdrasil.iter_file(path))
+            self._document["metadata"] = self._metadata = self._document.get(
+                "metadata", self._metadata
+            )
+        return self._document
+
+    @staticmethod
+    def parse(items: Iterable[Tuple[Optional[str], str, Any]]) -> Dict:
+        """由流式解析的键值对构建完整索引"""
+        data: Dict[str, Any] = {"packages": {}}
+        for parent, key, value in items:
+            if parent is None:
+                data[key] = value
+            else:
+                data["packages"][key] = value
+        return data
 
     def dump(self) -> None:
-        json.dump(self._data, self._source_path.open("w", encoding="utf-8"))
+        packages_file = Yggdrasil.packages_file()
+        Yggdrasil.write(
+            self._source_path.joinpath(packages_file),
+            compress.compress(
+                json.dumps(self._data, ensure_ascii=False).encode("utf-8"),
+                Yggdrasil.compression(),
+            ),
+        )
+        for path in Yggdrasil.index_files(self._source_path):
+            if path.name.startswith(PACKAGES_FILE) and path.name != packages_file:
+                path.unlink(missing_ok=True)
+        self.share()
+
+    def share(self) -> None:
+        """登记为进程内共享的最新索引"""
+        index_files = Yggdrasil.index_files(self._source_path)
+        self._stamp = stamp(*index_files)
+        self._registry.update((self.index, self._source_path), index_files, self)
+
+    @property
+    def stale(self) -> bool:
+        """本地索引在读取后是否被其他进程修改"""
+        return stamp(*Yggdrasil.index_files(self._source_path)) != self._stamp
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """缓存索引的同步校验信息 (ETag, Last-Modified, 版本号)"""
+        return Yggdrasil.try_loads(self._source_path.joinpath(SYNC_FILE)) or {}
+
+    @staticmethod
+    def revision(uuid: str) -> Any:
+        """本地缓存索引的版本标识, 无需解析索引"""
+        source_path = INDEX_PATH.joinpath(uuid)
+        validators = Yggdrasil.try_loads(source_path.joinpath(SYNC_FILE)) or {}
+        for key in ("revision", "etag", "last_modified"):
+            if validators.get(key) is not None:
+                return validators[key]
+        return stamp(*Yggdrasil.index_files(source_path))
+
+    @staticmethod
+    def is_fresh(uuid: str) -> bool:
+        """本地缓存索引是否仍在有效期内, 无需解析索引"""
+        source_path = INDEX_PATH.joinpath(uuid)
+        if not any(path.exists() for path in Yggdrasil.index_files(source_path)):
+            return False
+        validators = Yggdrasil.try_loads(source_path.joinpath(SYNC_FILE)) or {}
+        age = time.time() - validators.get("fetched_at", 0)
+        return age < validators.get("ttl", INDEX_TTL)
+
+    @staticmethod
+    def write(path: Path, content: bytes) -> None:
+        """先写入临时文件再重命名, 避免留下写了一半的索引文件"""
+        fs.atomic_write(path, content)
 
     @staticmethod
     def try_loads(path: Path) -> Union[Dict, Literal[False]]:
@@ -38,102 +230,524 @@ class Yggdrasil:
             return False
 
     @staticmethod
-    def check(source_path: Path):
-        """检查一个索引文件是否合法"""
-        if not (packages := Yggdrasil.try_loads(source_path)):
-            return False
-        return packages
+    def init(index: str, register: bool = True) -> "Yggdrasil":
+        """下载世界树索引, `register` 为假时由调用方负责登记到全局包锁"""
+        index = index.rstrip("/") + "/"
+        response = http.get(index + "json/" + SPARSE_FILE)
+        if response.ok and (Yggdrasil.loads(response.content) or {}).get("sparse"):
+            return Yggdrasil.store(index, response, sparse=True, register=register)
+        response = http.get(index + "json/" + PACKAGES_FILE, stream=True)
+        return Yggdrasil.store(index, response, register=register)
 
     @staticmethod
-    def init(index: str) -> "Yggdrasil":
-        from ipm.models.lock import PackageLock
+    def loads(content: bytes) -> Optional[Dict]:
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
 
-        lock_bytes = requests.get(
-            index.rstrip("/") + "/" + "json/packages.json"
-        ).content
+    @staticmethod
+    def store(
+        index: str,
+        response: requests.Response,
+        sparse: bool = False,
+        register: bool = True,
+        compression: Optional[str] = None,
+    ) -> "Yggdrasil":
+        """将完整的索引响应写入本地缓存
+
+        稀疏索引仅保存世界树元数据, 规则包在首次查询时才会被拉取;
+        完整索引边下载边解析并写入本地, 内存占用与索引大小无关,
+        `INDEX_BACKEND` 为 `sqlite` 时完整索引会被导入 SQLite 数据库.
+        `compression` 为世界树所提供的预压缩索引的格式.
+        """
+        from ipm.models.lock import PackageLock
 
-        temp_dir = tempfile.TemporaryDirectory()
-        temp_path = Path(temp_dir.name).resolve()
-        temp_lock_path = temp_path / "packages.json"
+        try:
+            if not response.ok:
+                raise LockLoadFailed(f"地址 [red]{index}[/] 不是合法的世界树服务器.")
+            if sparse:
+                if (metadata := Yggdrasil.loads(response.content)) is None:
+                    raise LockLoadFailed(
+                        f"地址 [red]{index}[/] 不是合法的世界树服务器."
+                    )
+                uuid = Yggdrasil.validate(index, metadata)
+                stored_file = SPARSE_FILE
+            else:
+                metadata, temp_path, search_index = Yggdrasil.ingest(
+                    index, response, compression
+                )
+                uuid = metadata["uuid"]
+                stored_file = (
+                    DATABASE_FILE
+                    if INDEX_BACKEND == "sqlite"
+                    else Yggdrasil.packages_file()
+                )
+        finally:
+            response.close()
 
-        temp_lock_file = temp_lock_path.open("wb")
-        temp_lock_file.write(lock_bytes)
-        temp_lock_file.close()
+        source_path = INDEX_PATH.joinpath(uuid)
+        source_path.mkdir(parents=True, exist_ok=True)
+        with FileLock(source_path):
+            if sparse:
+                Yggdrasil.write(source_path.joinpath(SPARSE_FILE), response.content)
+                source_path.joinpath(SEARCH_FILE).unlink(missing_ok=True)
+            else:
+                os.replace(temp_path, source_path.joinpath(stored_file))
+                os.replace(search_index.path, source_path.joinpath(SEARCH_FILE))
+            for stale_file in Yggdrasil.index_files(source_path):
+                if stale_file.name != stored_file:
+                    stale_file.unlink(missing_ok=True)
+            Yggdrasil.dump_validators(
+                source_path.joinpath(SYNC_FILE),
+                response,
+                revision=metadata.get("revision"),
+                fetched_at=time.time(),
+            )
 
-        if not (packages := Yggdrasil.check(temp_lock_path)):
-            raise LockLoadFailed(f"地址 [red]{index}[/] 不是合法的世界树服务器.")
+        if register:
+            PackageLock.load().update_index(index, uuid, str(source_path))
+        return Yggdrasil.load(index, uuid)
 
-        if "uuid" not in packages["metadata"].keys():
-            temp_dir.cleanup()
+    @staticmethod
+    def validate(index: str, metadata: Any) -> str:
+        """校验世界树元数据, 返回世界树标识"""
+        if not isinstance(metadata, dict) or "uuid" not in metadata.keys():
             raise LockLoadFailed(f"地址[{index}]不是合法的世界树服务器.")
-        uuid = packages["metadata"]["uuid"]
+        return metadata["uuid"]
 
-        source_path = INDEX_PATH.joinpath(uuid)
-        source_path.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(temp_lock_path, source_path.joinpath("packages.json"))
-        temp_dir.cleanup()
+    @staticmethod
+    def ingest(
+        index: str, response: requests.Response, compression: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Path, SearchWriter]:
+        """流式解析完整索引并写入临时文件, 返回世界树元数据、临时文件与检索索引
+
+        解析完成并确定世界树标识后, 由调用方将临时文件移动到缓存目录.
+        世界树元数据位于规则包之前时, 不合法的索引在下载开始时即被拒绝.
+        """
+        INDEX_PATH.mkdir(parents=True, exist_ok=True)
+        # 与其他缓存文件一样按 umask 创建, 共享缓存的其他用户同样可以读取
+        temp_path = fs.temp_path(INDEX_PATH.joinpath(PACKAGES_FILE))
+        temp_path.unlink(missing_ok=True)
+        search_index = SearchWriter(temp_path.with_suffix(".search"))
+        document: Dict[str, Any] = {}
+
+        chunks = response.iter_content(jsonstream.CHUNK_SIZE)
+        raw_file = None
+        if INDEX_BACKEND != "sqlite" and compression == Yggdrasil.compression():
+            # 压缩格式与本地一致时直接保存原始数据, 无需重新压缩
+            raw_file = temp_path.open("wb")
+            chunks = Yggdrasil.tee(chunks, raw_file)
+
+        def packages() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            for parent, key, value in jsonstream.iter_items(
+                compress.iter_decompress(chunks, compression), nested=("packages",)
+            ):
+                if parent is not None:
+                    search_index.add(key, value)
+                    yield key, value
+                elif key == "metadata":
+                    Yggdrasil.validate(index, value)
+                    document[key] = value
+                elif key != "packages":
+                    document[key] = value
 
-        lock = PackageLock()
-        lock.update_index(index, uuid, str(source_path))
-        return Yggdrasil(index, uuid)
+        try:
+            if INDEX_BACKEND == "sqlite":
+                database = IndexDatabase(temp_path)
+                try:
+                    database.ingest(packages())
+                    database.update_metadata(document.get("metadata", {}))
+                finally:
+                    database.close()
+            elif raw_file is not None:
+                with raw_file:
+                    for _ in packages():
+                        pass
+            else:
+                with compress.open_file(
+                    temp_path, "wb", Yggdrasil.compression()
+                ) as file:
+                    Yggdrasil.write_packages(file, packages(), document)
+            metadata = document.get("metadata")
+            Yggdrasil.validate(index, metadata)
+            search_index.close()
+        except BaseException as e:
+            temp_path.unlink(missing_ok=True)
+            search_index.discard()
+            if isinstance(e, ValueError):
+                raise LockLoadFailed(f"地址 [red]{index}[/] 不是合法的世界树服务器.")
+            raise
+        return metadata, temp_path, search_index
+
+    @staticmethod
+    def tee(chunks: Iterable[bytes], file: IO[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            file.write(chunk)
+            yield chunk
+
+    @staticmethod
+    def write_packages(
+        file: IO[bytes],
+        packages: Iterable[Tuple[str, Dict[str, Any]]],
+        document: Dict[str, Any],
+    ) -> None:
+        """逐个写入规则包
+
+        规则包之前已解析的字段 (通常为元数据) 写在规则包之前,
+        读取元数据时无需读完整个文件; 其余字段在规则包全部写入后追加.
+        """
+        packages = iter(packages)
+        first = next(packages, None)
+        written = list(document)
+        file.write(b"{")
+        for key in written:
+            file.write(
+                f"{json.dumps(key)}: {json.dumps(document[key], ensure_ascii=False)}, ".encode(
+                    "utf-8"
+                )
+            )
+        file.write(b'"packages": {')
+        if first is not None:
+            for i, (name, package) in enumerate(itertools.chain([first], packages)):
+                file.write(
+                    (
+                        (", " if i else "")
+                        + json.dumps(name, ensure_ascii=False)
+                        + ": "
+                        + json.dumps(package, ensure_ascii=False)
+                    ).encode("utf-8")
+                )
+        file.write(b"}")
+        for key, value in document.items():
+            if key not in written:
+                file.write(
+                    f", {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}".encode(
+                        "utf-8"
+                    )
+                )
+        file.write(b"}")
+
+    @staticmethod
+    def dump_validators(path: Path, response: requests.Response, **extra) -> None:
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "ttl": (Yggdrasil.try_loads(path) or {}).get("ttl"),
+            **extra,
+        }
+        Yggdrasil.write(
+            path,
+            json.dumps({k: v for k, v in validators.items() if v is not None}).encode(
+                "utf-8"
+            ),
+        )
+
+    @staticmethod
+    def conditional_headers(validators: Dict[str, Any]) -> Dict[str, str]:
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def sync(self, register: bool = True) -> bool:
+        """条件同步世界树, 返回本地索引是否发生了变化
+
+        未变化时服务器返回 `304`; 支持增量模式的服务器以 `226 IM Used`
+        返回自上一版本以来变化的规则包, 否则回退为完整下载.
+        """
+        if not self._metadata:
+            yggdrasil = Yggdrasil.init(self.index, register=register)
+            self.replace(yggdrasil)
+            return True
 
-    def sync(self):
-        yggdrasil = Yggdrasil.init(self.index)
+        with FileLock(self._source_path):
+            # 等待期间其他进程可能已经完成了同步
+            if self.stale:
+                self.replace(Yggdrasil.load(self.index, self.uuid))
+                if self.fresh:
+                    return True
+            return self._sync(register)
+
+    def _sync(self, register: bool) -> bool:
+        validators = self.validators
+        headers = Yggdrasil.conditional_headers(validators)
+        if self.sparse:
+            response = http.get(self.index + "json/" + SPARSE_FILE, headers=headers)
+            if response.status_code == 304:
+                self.touch()
+                return False
+            if response.status_code == 404:
+                yggdrasil = Yggdrasil.init(self.index, register=register)
+            else:
+                yggdrasil = Yggdrasil.store(
+                    self.index, response, sparse=True, register=register
+                )
+            self.replace(yggdrasil)
+            return True
+
+        headers["A-IM"] = DELTA_IM
+        if "revision" in validators:
+            headers["X-Yggdrasil-Revision"] = str(validators["revision"])
+
+        # 世界树在元数据中声明了预压缩的索引文件时, 优先下载压缩版本
+        compression = compress.choose(self._metadata.get("compressions"))
+        response = http.get(
+            self.index + "json/" + compress.filename(PACKAGES_FILE, compression),
+            headers=headers,
+            stream=True,
+        )
+        if response.status_code == 304:
+            response.close()
+            self.touch()
+            return False
+        if response.status_code == 226:
+            return self.patch(response, compression)
+
+        yggdrasil = Yggdrasil.store(
+            self.index, response, register=register, compression=compression
+        )
+        self.replace(yggdrasil)
+        return True
+
+    def replace(self, yggdrasil: "Yggdrasil") -> None:
+        """以重新同步得到的索引替换当前索引"""
+        if self._database is not yggdrasil._database:
+            self.close()
         self._source_path = yggdrasil._source_path
-        self._data = yggdrasil._data
+        self._document = yggdrasil._document
+        self._metadata = yggdrasil._metadata
+        self._database = yggdrasil._database
+        self._stamp = yggdrasil._stamp
+        self._distributions.clear()
+
+    def patch(
+        self, response: requests.Response, compression: Optional[str] = None
+    ) -> bool:
+        """应用增量索引: 覆盖变化的规则包并移除已删除的规则包"""
+        try:
+            delta = json.loads(compress.decompress(response.content, compression))
+        except ValueError:
+            raise LockLoadFailed(f"世界树 [red]{self.index}[/] 返回了无效的增量索引.")
+        metadata = delta.get("metadata", {})
+        if metadata.get("uuid", self.uuid) != self.uuid:
+            raise LockLoadFailed(f"世界树 [red]{self.index}[/] 的增量索引标识不匹配.")
+
+        packages = delta.get("packages", {})
+        removed = delta.get("removed", [])
+        for name in (*packages, *removed):
+            self.packages.pop(name, None)
+            self._distributions.pop(name, None)
+        self._metadata.update(metadata)
+        if self._database:
+            self._database.patch(metadata, packages, removed)
+            self.share()
+        else:
+            self.packages.update(packages)
+            self.dump()
+        search_index = SearchIndex(self._source_path.joinpath(SEARCH_FILE))
+        search_index.update(packages.items(), removed)
+        search_index.dump()
+        Yggdrasil.dump_validators(
+            self._source_path.joinpath(SYNC_FILE),
+            response,
+            revision=self._metadata.get("revision"),
+            fetched_at=time.time(),
+        )
+        return True
+
+    def update_validators(self, **validators) -> None:
+        Yggdrasil.write(
+            self._source_path.joinpath(SYNC_FILE),
+            json.dumps({**self.validators, **validators}).encode("utf-8"),
+        )
+
+    def touch(self) -> None:
+        """将本地索引标记为刚刚同步"""
+        self.update_validators(fetched_at=time.time())
+
+    @property
+    def ttl(self) -> float:
+        """本地索引的有效期 (秒)"""
+        return self.validators.get("ttl", INDEX_TTL)
+
+    @ttl.setter
+    def ttl(self, ttl: float) -> None:
+        self.update_validators(ttl=ttl)
+
+    @property
+    def fresh(self) -> bool:
+        """本地索引是否仍在有效期内, 有效期内无需访问世界树"""
+        age = time.time() - self.validators.get("fetched_at", 0)
+        return bool(self._metadata) and age < self.ttl
+
+    def get_package(self, name: str) -> Optional[Dict[str, Any]]:
+        """获取规则包索引, 稀疏索引下按需从世界树拉取"""
+        if name in self.packages:
+            return self.packages[name]
+        if self._database:
+            if (package := self._database.get_package(name)) is not None:
+                self.packages[name] = package
+            return package
+        if not self.sparse:
+            return None
+
+        package_path = self._source_path.joinpath("packages", f"{name}.json")
+        sync_path = package_path.with_name(f"{name}.{SYNC_FILE}")
+        validators = Yggdrasil.try_loads(sync_path) or {}
+        package = Yggdrasil.try_loads(package_path) if validators else None
+        revision = self._metadata.get("revision")
+        if package is not None and (
+            http.is_offline()
+            or (
+                validators.get("revision") == revision
+                if revision is not None
+                else time.time() - validators.get("fetched_at", 0) < SPARSE_TTL
+            )
+        ):
+            self.packages[name] = package
+            return package
+
+        response = http.get(
+            self.index + f"json/packages/{name}.json",
+            headers=Yggdrasil.conditional_headers(validators) if package else {},
+        )
+        if response.status_code == 304:
+            validators.update(revision=revision, fetched_at=time.time())
+            Yggdrasil.write(sync_path, json.dumps(validators).encode("utf-8"))
+        elif response.ok and (package := Yggdrasil.loads(response.content)):
+            package_path.parent.mkdir(parents=True, exist_ok=True)
+            Yggdrasil.write(package_path, response.content)
+            Yggdrasil.dump_validators(
+                sync_path, response, revision=revision, fetched_at=time.time()
+            )
+        elif response.status_code == 404:
+            return None
+        else:
+            raise LockLoadFailed(f"世界树 [red]{self.index}[/] 返回了无效的规则包索引.")
+
+        self.packages[name] = package
+        return package
+
+    def search(self, query: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """在同步时构建的倒排索引中检索规则包"""
+        return SearchIndex(self._source_path.joinpath(SEARCH_FILE)).search(query)
+
+    def get_distributions(self, name: str) -> Dict[str, Distribution]:
+        """获取规则包 `版本号 -> 发行版` 查找表, 每个规则包只构建一次"""
+        if name in self._distributions:
+            return self._distributions[name]
+        if self._database:
+            distributions = self._distributions[name] = {
+                version: Distribution(version, url, hash)
+                for version, url, hash in self._database.get_distributions(name)
+            }
+            return distributions
+        if not (package := self.get_package(name)):
+            return {}
+        distributions = self._distributions[name] = {
+            distribution["version"]: Distribution(
+                distribution["version"],
+                distribution["download_url"],
+                distribution.get("hash"),
+            )
+            for distribution in package.get("distributions", [])
+        }
+        return distributions
+
+    def lookup(self, names: Iterable[str]) -> Dict[str, Dict[str, Distribution]]:
+        """批量获取多个规则包的查找表, SQLite 索引只需一次查询
+
+        `(规则包, 版本号)` 对应的发行版即 `lookup(names)[name].get(version)`.
+        """
+        names = list(dict.fromkeys(names))
+        if self._database and (
+            missing := [name for name in names if name not in self._distributions]
+        ):
+            rows = self._database.lookup_distributions(missing)
+            for name in missing:
+                self._distributions[name] = {
+                    version: Distribution(version, url, hash)
+                    for version, url, hash in rows.get(name, [])
+                }
+        return {name: self.get_distributions(name) for name in names}
+
+    def get_distribution(
+        self, name: str, version: Optional[str] = None
+    ) -> Optional[Distribution]:
+        """获取规则包的特定发行版, 未指定版本时返回最新版本"""
+        if not (distributions := self.get_distributions(name)):
+            return None
+        return distributions.get(version or self.get_lastest_version(name) or "")
 
     def get_url(self, name: str, version: Optional[str]) -> Optional[str]:
         """从本地读取规则包下载链接"""
-        if name not in self.packages:
-            return None
-        package = self.packages[name]
-        match_version = version or package["latestVersion"]
-        for distribution in package["distributions"]:
-            if distribution["version"] == match_version:
-                return distribution["download_url"]
+        if distribution := self.get_distribution(name, version):
+            return distribution.url
 
     def get_hash(self, name: str, version: str) -> Optional[str]:
         """从本地获取规则包哈希值"""
-        if name not in self.packages:
-            return None
-        package = self.packages[name]
-        match_version = version or package["latestVersion"]
-        for distribution in package["distributions"]:
-            if distribution["version"] == match_version:
-                return distribution["hash"]
+        if distribution := self.get_distribution(name, version):
+            return distribution.hash
 
     def get_lastest_version(self, name: str) -> Optional[str]:
-        """从本地获取规则包最新版本"""
-        if name not in self.packages:
-            return None
-        return self.packages[name]["latestVersion"]
+        """从本地获取规则包最新版本, 索引未声明时以发行版中最大的版本号为准"""
+        if self._database and name not in self.packages:
+            version = self._database.get_lastest_version(name)
+        else:
+            version = (self.get_package(name) or {}).get("latestVersion")
+        if version:
+            return version
+        if distributions := self.get_distributions(name):
+            return max(distributions, key=Version)
+        return None
 
-    def get_requirements(self, name: str) -> List["Requirement"]:
-        if not name in self.packages:
+    def get_dependencies(
+        self, name: str, version: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """获取规则包某一版本声明的依赖, 发行版未单独声明时使用规则包的依赖"""
+        if not (package := self.get_package(name)):
             return []
-        from ipm.models.requirement import Requirement
-
-        res = []
-        requirements = self.packages[name]["requirements"]
-        for requirement in requirements:
-            res.append(
-                Requirement(
-                    requirement["name"],
-                    requirement["version"],
-                    url=requirement.get(
-                        "url",
-                        f"/packages/{requirement['name']}-{requirement['version']}.ipk",
-                    ),
-                    yggdrasil=self,
-                )
-            )
-        return res
+        for distribution in package.get("distributions", []):
+            if distribution["version"] == version and "requirements" in distribution:
+                return distribution["requirements"]
+        return package.get("requirements", [])
 
     @property
     def uuid(self) -> str:
         """世界树唯一标识"""
-        return self._data["metadata"]["uuid"]
+        return self._metadata["uuid"]
+
+    @property
+    def sparse(self) -> bool:
+        """是否为按需拉取规则包的稀疏索引"""
+        return bool(self._metadata) and self._metadata.get("sparse", False)
 
     @property
     def packages(self) -> Dict[str, Any]:
         return self._data["packages"]
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self._metadata
+
+    def iter_packages(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """遍历本地已有的全部规则包, 稀疏索引仅包含已拉取的规则包"""
+        if self._database:
+            yield from self._database.iter_packages()
+        elif self.sparse:
+            for path in sorted(self._source_path.glob("packages/*.json")):
+                if not path.name.endswith("." + SYNC_FILE) and (
+                    package := Yggdrasil.try_loads(path)
+                ):
+                    yield path.stem, package
+        elif self._document is None and (path := self.packages_path()):
+            # 尚未解析的完整索引直接从文件流式读取, 不构建完整的字典
+            for parent, name, package in Yggdrasil.iter_file(path):
+                if parent is not None:
+                    yield name, package
+        else:
+            yield from self.packages.items()
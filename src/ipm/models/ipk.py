@@ -3,9 +3,8 @@ from typing import Any, Optional, Union
 from tomlkit.toml_document import TOMLDocument
 
 from ipm.const import INDEX
-from ipm.models.requirement import Requirements
 from ipm.utils.hash import ifp_hash
-from ipm.models.lock import PackageLock
+from ipm.utils.toml import TomlFile
 from ipm.typing import List, Dict, Literal, StrPath
 from ipm.exceptions import ProjectError, TomlLoadFailed
 
@@ -13,9 +12,6 @@ import tomlkit
 import abc
 
 
-global_lock = PackageLock()
-
-
 class Author:
     name: str
     email: str
@@ -53,7 +49,7 @@ class InfiniPackage(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-class InfiniProject(InfiniPackage):
+class InfiniProject(TomlFile, InfiniPackage):
     def __init__(self, path: StrPath = ".") -> None:
         self._source_path = Path(path).resolve()
         self._toml_path = self._source_path / "infini.toml"
@@ -65,15 +61,9 @@ class InfiniProject(InfiniPackage):
                 f"项目文件[infini.toml]不存在, 请先使用`[bold green]ipm init[/]`初始化!"
             )
 
-        self._data = self.read()
-        if "project" not in self._data:
+        if "project" not in self.data:
             raise TomlLoadFailed(f"项目文件[infini.toml]中不存在元数据!")
 
-    def read(self) -> TOMLDocument:
-        if not self._toml_path.exists():
-            return tomlkit.document()
-        return tomlkit.load(self._toml_path.open("r", encoding="utf-8"))
-
     def dumps(self) -> str:
         return tomlkit.dumps(self._data)
 
@@ -122,7 +112,7 @@ class InfiniProject(InfiniPackage):
 
     @property
     def metadata(self) -> dict:
-        return self._data.unwrap()["project"]
+        return self.data["project"]
 
     @property
     def readme(self) -> str:
@@ -131,7 +121,7 @@ class InfiniProject(InfiniPackage):
 
     @property
     def readme_file(self) -> str:
-        project: dict = self._data.unwrap().get("project", {})
+        project: dict = self.data.get("project", {})
         if not project:
             raise ProjectError("项目文件中不存在`project`项!")
         if "readme" not in project.keys():
@@ -143,55 +133,45 @@ class InfiniProject(InfiniPackage):
 
     @property
     def name(self) -> str:
-        return self._data.unwrap()["project"]["name"]
+        return self.data["project"]["name"]
 
     @property
     def version(self) -> str:
-        return self._data.unwrap()["project"]["version"]
+        return self.data["project"]["version"]
 
     @property
     def description(self) -> str:
-        return self._data.unwrap()["project"]["description"]
+        return self.data["project"]["description"]
 
     @property
     def authors(self) -> Authors:
-        return Authors(self._data.unwrap()["project"]["authors"])
+        return Authors(self.data["project"]["authors"])
 
     @property
     def homepage(self) -> str:
-        return self._data.unwrap()["project"]["urls"]["homepage"]
+        return self.data["project"]["urls"]["homepage"]
 
     @property
     def urls(self) -> Dict[str, str]:
-        return self._data.unwrap()["project"].get("urls", {})
+        return self.data["project"].get("urls", {})
 
     @property
     def license(self) -> str:
-        return self._data.unwrap()["project"]["license"]
+        return self.data["project"]["license"]
 
     @property
     def dependencies(self) -> Dict[str, str]:
-        return self._data.unwrap().get("dependencies", {})
-
-    @property
-    def requirements(self) -> Requirements:
-        return Requirements(
-            self._data.unwrap().get("requirements", {}),
-            yggdrasils={
-                name: global_lock.get_yggdrasil_by_index(url)
-                for name, url in self.yggdrasils.items()
-            },
-        )
+        return self.data.get("dependencies", {})
 
     @property
     def yggdrasils(self) -> Dict[str, str]:
-        res = {name: index for name, index in self._data.get("yggdrasils", {}).items()}
+        res = {name: index for name, index in self.data.get("yggdrasils", {}).items()}
         res.update({"official": INDEX})
         return res
 
     @property
     def topics(self) -> List[str]:
-        return self._data.unwrap()["project"].get("topics", [])
+        return self.data["project"].get("topics", [])
 
 
 class InfiniFrozenPackage(InfiniPackage):
@@ -1,13 +1,19 @@
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 from abc import ABCMeta
-from typing import Any, List, Optional
-from ipm.models.requirement import Requirement
+from typing import Any, ContextManager, Iterator, List, NamedTuple, Optional, Tuple
 from ipm.typing import Dict, StrPath
 from ipm.const import IPM_PATH, ATTENTIONS
-from tomlkit import TOMLDocument
+from ipm.utils import fs
+from ipm.utils.fs import FileLock
+from ipm.utils.graph import DependencyGraph
+from ipm.utils.registry import FileRegistry, stamp
+from ipm.utils.toml import TomlFile
 from typing import TYPE_CHECKING
 
 import tomlkit
+import hashlib
+import json
 
 
 if TYPE_CHECKING:
@@ -15,7 +21,7 @@ if TYPE_CHECKING:
     from ipm.models.index import Yggdrasil
 
 
-class IPMLock(metaclass=ABCMeta):
+class IPMLock(TomlFile, metaclass=ABCMeta):
     """IPM 锁基类"""
 
     _lock_path: Path
@@ -23,104 +29,216 @@ class IPMLock(metaclass=ABCMeta):
 
     def __init__(self, source_path: StrPath) -> None:
         self._lock_path = Path(source_path).resolve().joinpath("infini.lock")
-        self._data = self.read()
-
-    def read(self) -> TOMLDocument:
-        if not self._lock_path.exists():
-            return tomlkit.document()
-        return tomlkit.load(self._lock_path.open("r", encoding="utf-8"))
+        self._toml_path = self._lock_path
+        self._depth = 0
+        self._dirty = False
 
     def dumps(self) -> str:
         return tomlkit.dumps(self._data)
 
     def dump(self) -> None:
+        """写入锁文件, 事务中的修改会在事务结束时统一写入"""
+        if self._depth:
+            self._dirty = True
+            return
+        self.write()
+
+    def write(self) -> None:
+        """先写入临时文件再重命名, 避免留下写了一半的锁文件"""
         doc = tomlkit.document()
         for attention in ATTENTIONS:
             doc.add(tomlkit.comment(attention))
         doc.update(self._data)
-        return tomlkit.dump(
-            doc, self._lock_path.open("w", encoding="utf-8"), sort_keys=True
-        )
+        with self.locked(), fs.atomic_open(
+            self._lock_path, "w", encoding="utf-8"
+        ) as file:
+            tomlkit.dump(doc, file, sort_keys=True)
+        self._stamp = stamp(self._lock_path)
+
+    def locked(self) -> ContextManager[Any]:
+        """写入锁文件时持有的进程锁, 项目锁只属于单个项目, 无需加锁"""
+        return nullcontext()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """合并上下文中的全部修改, 退出时只写入一次锁文件
+
+        事务期间持有 `locked` 返回的进程锁, 开始时若锁文件已被其他进程修改则重新读取.
+        已完成的修改对应的文件已经落盘, 因此发生异常时同样会被写入.
+        """
+        with self.locked():
+            if not self._depth and self.stale:
+                self.reload()
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth and self._dirty:
+                    self._dirty = False
+                    self.write()
 
 
 class PackageLock(IPMLock):
     """全局包锁"""
 
+    _registry: FileRegistry["PackageLock"] = FileRegistry()
+
     def __init__(self, source_path: Optional[StrPath] = None) -> None:
         super().__init__(source_path=source_path or IPM_PATH)
+        self._build_lookups()
+
+    def loaded(self) -> None:
+        self._build_lookups()
+
+    def _build_lookups(self) -> None:
+        """建立规则包与世界树的查找表, 查询时无需遍历整个锁文件"""
+        self._packages: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._indexes: Dict[str, Any] = {}
+        self._uuids: Dict[str, Any] = {}
+        self._hashes: Dict[str, Any] = {}
+        data = self.data if self._document is None else self._document
+        for package in data.get("package", []):
+            self._packages.setdefault((package["name"], package["version"]), package)
+            if package.get("hash"):
+                self._hashes[package["hash"]] = package
+        for index in data.get("index", []):
+            self._indexes.setdefault(PackageLock.normalize(index["url"]), index)
+            self._uuids.setdefault(index["uuid"], index)
+
+    @staticmethod
+    def normalize(index: str) -> str:
+        return index.strip("/")
+
+    @classmethod
+    def load(cls, source_path: Optional[StrPath] = None) -> "PackageLock":
+        """获取进程内共享的全局包锁, 锁文件未变化时不会重复解析"""
+        lock_path = Path(source_path or IPM_PATH).resolve().joinpath("infini.lock")
+        return cls._registry.get(
+            lock_path, (lock_path,), lambda: cls(source_path=lock_path.parent)
+        )
+
+    def locked(self) -> ContextManager[Any]:
+        """全局包锁由多个进程共享, 写入时持有 `.lock` 文件锁"""
+        return FileLock(self._lock_path)
+
+    def write(self) -> None:
+        super().write()
+        self._registry.update(self._lock_path, (self._lock_path,), self)
 
     def update_index(self, index: str, uuid: str, lock_path: str) -> bool:
-        indexes = self._data.get("index", tomlkit.aot())
-        for i in indexes:
-            if i["uuid"] == uuid:
+        """登记世界树索引, 返回锁内容是否发生了变化"""
+        with self.transaction():
+            i = self._uuids.get(uuid)
+            if i is not None and i["url"] == index and i["lock"] == lock_path:
+                return False
+            # 切换为可修改的文档, 查找表会随之指向文档中的条目
+            document = self._data
+            if (i := self._uuids.get(uuid)) is not None:
+                if self._indexes.get(PackageLock.normalize(i["url"])) is i:
+                    del self._indexes[PackageLock.normalize(i["url"])]
                 i["url"] = index
                 i["lock"] = lock_path
-                self._data["index"] = indexes
-                break
-        else:
-            aot = tomlkit.aot()
-            aot.append(tomlkit.item({"url": index, "uuid": uuid, "lock": lock_path}))
-            self._data.add("index", aot)
-        self.dump()
-        return True
+            else:
+                aot = tomlkit.aot()
+                aot.append(
+                    tomlkit.item({"url": index, "uuid": uuid, "lock": lock_path})
+                )
+                document.add("index", aot)
+                i = self._uuids[uuid] = document["index"][-1]  # type: ignore
+            self._indexes.setdefault(PackageLock.normalize(index), i)
+            self.dump()
+            return True
 
     def has_index(self, index: Any) -> bool:
-        for i in self._data.get("index", tomlkit.aot()):
-            if i["url"].strip("/") == index.strip("/"):
-                return True
-        else:
-            return False
+        return PackageLock.normalize(index) in self._indexes
 
     def get_all_indexes(self) -> List["Yggdrasil"]:
         from ipm.models.index import Yggdrasil
 
-        if "index" not in self._data.keys():
-            return []
         res = []
-        for index in self._data["index"]:  # type: ignore
-            res.append(Yggdrasil(index["url"], index["uuid"]))
+        for index in self.data.get("index", []):
+            res.append(Yggdrasil.load(index["url"], index["uuid"]))
         return res
 
+    def get_uuid_by_index(self, index: str) -> Optional[str]:
+        if (i := self._indexes.get(PackageLock.normalize(index))) is None:
+            return None
+        return i["uuid"]
+
     def get_yggdrasil_by_index(self, index: str) -> Optional["Yggdrasil"]:
         from ipm.models.index import Yggdrasil
 
-        indexes = self._data.get("index", [])
-        for i in indexes:
-            if i["url"] == index:
-                return Yggdrasil(i["url"], i["uuid"])
-        return None
+        if (i := self._indexes.get(PackageLock.normalize(index))) is None:
+            return None
+        return Yggdrasil.load(i["url"], i["uuid"])
 
     def has_frozen_package(self, name: str, version: str) -> bool:
-        data = self._data.unwrap()
-        for package in data.get("package", []):
-            if package["name"] == name and package["version"] == version:
-                return True
-        return False
+        return (name, version) in self._packages
 
     def add_frozen_package(
         self, name: str, version: str, hash: str, yggdrasil: str, path: str
     ):
-        aot = tomlkit.aot()
-        aot.append(
-            tomlkit.item(
-                {
-                    "name": name,
-                    "version": version,
-                    "hash": hash,
-                    "yggdrasil": yggdrasil,
-                    "path": path,
-                }
+        with self.transaction():
+            document = self._data
+            aot = tomlkit.aot()
+            aot.append(
+                tomlkit.item(
+                    {
+                        "name": name,
+                        "version": version,
+                        "hash": hash,
+                        "yggdrasil": yggdrasil,
+                        "path": path,
+                    }
+                )
             )
-        )
-        self._data.add("package", aot)
-        self.dump()
+            document.add("package", aot)
+            package = document["package"][-1]  # type: ignore
+            self._packages.setdefault((name, version), package)
+            if hash:
+                self._hashes[hash] = package
+            self.dump()
 
     def get_frozen_package_path(self, name: str, version: str) -> Optional[Path]:
-        data = self._data.unwrap()
-        for package in data.get("package", []):
-            if package["name"] == name and package["version"] == version:
-                return Path(package["path"])
-        return
+        if (package := self._packages.get((name, version))) is None:
+            return None
+        return Path(package["path"])
+
+    def get_frozen_package_path_by_hash(self, hash: str) -> Optional[Path]:
+        """按内容哈希查找已存储的规则包"""
+        if (package := self._hashes.get(hash)) is None:
+            return None
+        return Path(package["path"])
+
+    def find_frozen_package(
+        self, name: str, version: str, hash: Optional[str] = None
+    ) -> Optional[Path]:
+        """查找已存储的规则包, 给出哈希时仅按哈希匹配"""
+        if not hash:
+            return self.get_frozen_package_path(name, version)
+        if (path := self.get_frozen_package_path_by_hash(hash)) and path.is_file():
+            return path
+        return None
+
+
+class LockedPackage(NamedTuple):
+    """项目锁中记录的规则包, 读取时无需加载世界树索引"""
+
+    name: str
+    version: str
+    yggdrasil: Optional[str] = None
+    url: Optional[str] = None
+    path: Optional[str] = None
+    hash: Optional[str] = None
+    dependencies: Tuple[str, ...] = ()
+
+    def is_local(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def download_url(self) -> str:
+        return (self.yggdrasil or "").rstrip("/") + (self.url or "")
 
 
 class ProjectLock(IPMLock):
@@ -135,7 +253,7 @@ class ProjectLock(IPMLock):
     def init_from_project(
         project: "ipk.InfiniProject", dist_path: Optional[Path] = None
     ) -> "ProjectLock":
-        from ipm.utils.resolve import get_requirements_by_project
+        from ipm.utils.resolve import resolve_project
 
         lock = ProjectLock(dist_path or project._source_path)
         lock._data = tomlkit.document()
@@ -145,32 +263,64 @@ class ProjectLock(IPMLock):
         metadata.add("version", project.version)
         metadata.add("description", project.description)
         metadata.add("license", project.license)
+        metadata.add("fingerprint", ProjectLock.fingerprint(project))
         lock._data.add("metadata", metadata)
 
         packages = tomlkit.aot()
-        requirements = get_requirements_by_project(project)
-
-        for requirement in requirements:
-            if requirement.is_local():
-                packages.append(tomlkit.item(requirement.as_dict()))
-            else:
-                packages.append(tomlkit.item(requirement.as_dict()))
+        for package in resolve_project(project):
+            packages.append(tomlkit.item(package))
         lock._data.add("package", packages)
 
         return lock
 
-    @property
-    def requirements(self) -> List[Requirement]:
-        from ipm.models.lock import PackageLock
+    @staticmethod
+    def fingerprint(project: "ipk.InfiniProject") -> str:
+        """项目依赖输入的指纹
+
+        由 `infini.toml` 中影响锁文件的内容与所用世界树的标识及版本计算得到,
+        指纹未变化时无需重新解析依赖.
+        """
+        from ipm.utils.resolve import get_inputs_by_project
+
+        content = {
+            "project": [
+                project.name,
+                project.version,
+                project.description,
+                project.license,
+            ],
+            **get_inputs_by_project(project),
+        }
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def up_to_date(self, project: "ipk.InfiniProject") -> bool:
+        """锁文件是否由当前的项目依赖输入生成"""
+        return self.data.get("metadata", {}).get(
+            "fingerprint"
+        ) == ProjectLock.fingerprint(project)
 
-        global_lock = PackageLock()
+    @property
+    def packages(self) -> List[LockedPackage]:
         return [
-            Requirement(
+            LockedPackage(
                 package["name"],
                 package["version"],
-                path=package.get("path"),
+                yggdrasil=package.get("yggdrasil"),
                 url=package.get("url"),
-                yggdrasil=global_lock.get_yggdrasil_by_index(package.get("yggdrasil")),
+                path=package.get("path"),
+                hash=package.get("hash"),
+                dependencies=tuple(package.get("dependencies", ())),
             )
-            for package in self._data.unwrap().get("package", [])
+            for package in self.data.get("package", [])
         ]
+
+    @property
+    def graph(self) -> DependencyGraph[LockedPackage]:
+        """锁文件记录的依赖图"""
+        graph: DependencyGraph[LockedPackage] = DependencyGraph()
+        for package in self.packages:
+            graph.add(package.name, package, package.dependencies)
+        return graph
+
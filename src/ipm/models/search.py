@@ -0,0 +1,185 @@
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ipm.typing import Dict
+from ipm.utils import fs, jsonstream
+
+import json
+import os
+import re
+
+SEARCH_FILE = "search.json"
+WORD = re.compile(r"[a-z0-9]+|[\u3400-\u9fff]+")
+
+
+def tokenize(text: str) -> Set[str]:
+    """拆分检索词: 英文与数字按词拆分, 中文按相邻两字拆分"""
+    tokens = set()
+    for word in WORD.findall(text.lower()):
+        if word.isascii() or len(word) == 1:
+            tokens.add(word)
+        else:
+            tokens.update(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class SearchIndex:
+    """世界树规则包的倒排索引, 覆盖包名、简介与话题
+
+    文件中逐个保存规则包及其词条, 倒排表在读取时构建,
+    因此同步时可以边解析边写入, 无需在内存中累积整个索引.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.tokens: Dict[str, List[str]] = {}
+        self._sorted_tokens: Optional[List[str]] = None
+        for name, document in self.read():
+            tokens = document.pop("tokens", None)
+            self.index(name, document, tokens or self.document_tokens(name, document))
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def read(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        try:
+            with self._path.open("rb") as file:
+                for parent, name, document in jsonstream.iter_items(
+                    iter(lambda: file.read(jsonstream.CHUNK_SIZE), b""),
+                    nested=("documents",),
+                ):
+                    if parent is not None:
+                        yield name, document
+        except (OSError, ValueError):
+            return
+
+    def dump(self) -> None:
+        writer = SearchWriter(fs.temp_path(self._path))
+        try:
+            for name, document in self.documents.items():
+                writer.write(name, document)
+            writer.close()
+        except BaseException:
+            writer.discard()
+            raise
+        os.replace(writer.path, self._path)
+
+    @staticmethod
+    def document_tokens(name: str, document: Dict[str, Any]) -> Set[str]:
+        return tokenize(
+            " ".join(
+                (
+                    name,
+                    name.replace("-", " ").replace("_", " "),
+                    document.get("description") or "",
+                    *document.get("topics", []),
+                )
+            )
+        )
+
+    def update(
+        self,
+        packages: Iterable[Tuple[str, Dict[str, Any]]],
+        removed: Iterable[str] = (),
+    ) -> None:
+        """增量更新索引: 仅重建变化的规则包的词条"""
+        packages = list(packages)
+        for name in (*(name for name, _ in packages), *removed):
+            if (document := self.documents.pop(name, None)) is None:
+                continue
+            for token in self.document_tokens(name, document):
+                if token in self.tokens:
+                    self.tokens[token].remove(name)
+                    if not self.tokens[token]:
+                        del self.tokens[token]
+
+        for name, package in packages:
+            self.add(name, package)
+
+    def add(self, name: str, package: Dict[str, Any]) -> None:
+        """添加一个尚未收录的规则包"""
+        document = self.document(package)
+        self.index(name, document, self.document_tokens(name, document))
+
+    def index(self, name: str, document: Dict[str, Any], tokens: Iterable[str]) -> None:
+        self.documents[name] = document
+        for token in tokens:
+            self.tokens.setdefault(token, []).append(name)
+        self._sorted_tokens = None
+
+    @staticmethod
+    def document(package: Dict[str, Any]) -> Dict[str, Any]:
+        """规则包索引中参与检索与展示的字段"""
+        return {
+            "description": package.get("description") or "",
+            "version": package.get("latestVersion"),
+            "topics": list(package.get("topics", [])),
+        }
+
+    def match(self, token: str) -> Set[str]:
+        """查找以 `token` 为前缀的词条所对应的规则包"""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self.tokens)
+        res = set()
+        for i in range(
+            bisect_left(self._sorted_tokens, token), len(self._sorted_tokens)
+        ):
+            if not self._sorted_tokens[i].startswith(token):
+                break
+            res.update(self.tokens[self._sorted_tokens[i]])
+        return res
+
+    def search(self, query: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """检索规则包, 包名完全匹配或以检索词开头的结果优先"""
+        if not (tokens := tokenize(query)):
+            return []
+        names = set.intersection(*(self.match(token) for token in tokens))
+        query = query.strip().lower()
+        return [
+            (name, self.documents[name])
+            for name in sorted(
+                names,
+                key=lambda name: (
+                    name.lower() != query,
+                    not name.lower().startswith(query),
+                    name,
+                ),
+            )
+        ]
+
+
+class SearchWriter:
+    """逐个写入规则包的检索索引, 内存占用与索引大小无关"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = path.open("wb")
+        self._file.write(b'{"documents": {')
+        self._count = 0
+
+    def add(self, name: str, package: Dict[str, Any]) -> None:
+        self.write(name, SearchIndex.document(package))
+
+    def write(self, name: str, document: Dict[str, Any]) -> None:
+        tokens = sorted(SearchIndex.document_tokens(name, document))
+        self._file.write(
+            (
+                (", " if self._count else "")
+                + json.dumps(name, ensure_ascii=False)
+                + ": "
+                + json.dumps({**document, "tokens": tokens}, ensure_ascii=False)
+            ).encode("utf-8")
+        )
+        self._count += 1
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.write(b"}}")
+            self._file.close()
+
+    def discard(self) -> None:
+        self._file.close()
+        self.path.unlink(missing_ok=True)
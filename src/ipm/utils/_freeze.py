@@ -27,7 +27,7 @@ def create_xml_file(meta_data: InfiniProject, output_folder: StrPath) -> None:
     from collections import defaultdict
 
     meta_data_dict = defaultdict(
-        lambda: "", meta_data._data.get("project")  # type: ignore
+        lambda: "", meta_data.data.get("project")  # type: ignore
     )
 
     Path(output_folder).joinpath(f"{meta_data.name}.xml").write_text(
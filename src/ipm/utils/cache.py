@@ -0,0 +1,69 @@
+from pathlib import Path
+from typing import Any, List, Optional
+
+from ipm.const import RESOLVE_CACHE_PATH, RESOLVE_CACHE_SIZE
+from ipm.typing import Dict
+from ipm.utils import fs
+
+import hashlib
+import json
+import os
+
+# 缓存条目的格式版本, 条目结构变化时递增, 使旧格式的结果不再被命中
+RESOLVE_CACHE_FORMAT = 2
+
+
+class ResolveCache:
+    """依赖解析结果的磁盘缓存
+
+    每条结果以输入摘要命名, 查找只需读取一个文件; 命中时刷新文件修改时间,
+    总大小超过上限时按修改时间淘汰最久未使用的结果.
+    """
+
+    def __init__(
+        self, path: Optional[Path] = None, max_size: int = RESOLVE_CACHE_SIZE
+    ) -> None:
+        self._path = path or RESOLVE_CACHE_PATH
+        self._max_size = max_size
+
+    @staticmethod
+    def key(inputs: Dict[str, Any]) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                {"format": RESOLVE_CACHE_FORMAT, "inputs": inputs},
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._path.joinpath(f"{key}.json")
+        try:
+            entries = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entries if isinstance(entries, list) else None
+
+    def put(self, key: str, entries: List[Dict[str, Any]]) -> None:
+        self._path.mkdir(parents=True, exist_ok=True)
+        fs.atomic_write(
+            self._path.joinpath(f"{key}.json"),
+            json.dumps(entries, ensure_ascii=False).encode("utf-8"),
+        )
+        self.evict()
+
+    def evict(self) -> None:
+        """淘汰最久未使用的结果, 直到总大小不超过上限"""
+        files = []
+        for path in self._path.glob("*.json"):
+            try:
+                files.append((path.stat(), path))
+            except OSError:
+                continue
+        size = sum(stat.st_size for stat, _ in files)
+        for stat, path in sorted(files, key=lambda file: file[0].st_mtime_ns):
+            if size <= self._max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
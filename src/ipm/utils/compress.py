@@ -0,0 +1,87 @@
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from ipm.typing import Dict
+
+import gzip
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    decompressor: Callable[[], Any]
+    open: Callable[[Path, str], IO[bytes]]
+
+
+def _open_zstd(path: Path, mode: str) -> IO[bytes]:
+    if "w" in mode:
+        return zstandard.ZstdCompressor().stream_writer(path.open("wb"))
+    return zstandard.ZstdDecompressor().stream_reader(path.open("rb"))
+
+
+CODECS: Dict[str, Codec] = {
+    "gz": Codec(
+        lambda content: gzip.compress(content, compresslevel=6),
+        lambda: zlib.decompressobj(wbits=zlib.MAX_WBITS | 16),
+        lambda path, mode: gzip.open(path, mode, compresslevel=6),
+    ),
+    "xz": Codec(lzma.compress, lzma.LZMADecompressor, lzma.open),
+}
+if zstandard is not None:
+    CODECS["zst"] = Codec(
+        lambda content: zstandard.ZstdCompressor().compress(content),
+        lambda: zstandard.ZstdDecompressor().decompressobj(),
+        _open_zstd,
+    )
+
+# 按解压速度排序的优先级
+PREFERENCE = ("zst", "gz", "xz")
+
+
+def choose(available: Optional[list]) -> Optional[str]:
+    """在服务器提供的压缩格式中选择本地支持且解压最快的一种"""
+    for compression in PREFERENCE:
+        if compression in CODECS and compression in (available or []):
+            return compression
+    return None
+
+
+def compress(content: bytes, compression: Optional[str]) -> bytes:
+    return CODECS[compression].compress(content) if compression else content
+
+
+def decompress(content: bytes, compression: Optional[str]) -> bytes:
+    return b"".join(iter_decompress((content,), compression))
+
+
+def iter_decompress(
+    chunks: Iterable[bytes], compression: Optional[str]
+) -> Iterator[bytes]:
+    """逐块解压数据流"""
+    if not compression:
+        yield from chunks
+        return
+    decompressor = CODECS[compression].decompressor()
+    for chunk in chunks:
+        if data := decompressor.decompress(chunk):
+            yield data
+
+
+def open_file(
+    path: Path, mode: str = "rb", compression: Optional[str] = None
+) -> IO[bytes]:
+    """打开文件并流式解压或压缩, 未指定压缩格式时按后缀判断"""
+    compression = compression or path.suffix.lstrip(".")
+    if compression in CODECS:
+        return CODECS[compression].open(path, mode)
+    return path.open(mode)
+
+
+def filename(name: str, compression: Optional[str]) -> str:
+    return f"{name}.{compression}" if compression else name
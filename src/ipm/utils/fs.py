@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator
+
+import threading
+import shutil
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def temp_path(path: Path) -> Path:
+    """同目录下进程与线程唯一的临时文件路径"""
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+@contextmanager
+def atomic_open(path: Path, mode: str = "wb", **kwargs) -> Iterator[IO[Any]]:
+    """写入临时文件, 成功后重命名为目标文件
+
+    读取方总能看到完整的旧文件或新文件, 因此读取时无需加锁.
+    """
+    temp = temp_path(path)
+    try:
+        with temp.open(mode, **kwargs) as file:
+            yield file
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write(path: Path, content: bytes) -> None:
+    with atomic_open(path) as file:
+        file.write(content)
+
+
+def copy_atomic(source: Path, target: Path) -> None:
+    """复制到临时文件后重命名, 其他进程不会读到复制了一半的文件"""
+    temp = temp_path(target)
+    try:
+        shutil.copy2(source, temp)
+        os.replace(temp, target)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+class FileLock:
+    """基于 `fcntl.flock` 的进程间建议锁
+
+    锁定 `path` 旁的 `.lock` 文件, 同一线程内可重入; 不支持 `fcntl` 的平台不加锁.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, path: Path) -> None:
+        self._path = path.with_name(path.name + ".lock")
+
+    @property
+    def _held(self) -> Dict[Path, list]:
+        if not hasattr(self._local, "held"):
+            self._local.held = {}
+        return self._local.held
+
+    def __enter__(self) -> "FileLock":
+        if (entry := self._held.get(self._path)) is not None:
+            entry[1] += 1
+            return self
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+        self._held[self._path] = [fd, 1]
+        return self
+
+    def __exit__(self, *args) -> None:
+        entry = self._held[self._path]
+        entry[1] -= 1
+        if entry[1]:
+            return
+        del self._held[self._path]
+        if fcntl is not None:
+            fcntl.flock(entry[0], fcntl.LOCK_UN)
+        os.close(entry[0])
@@ -0,0 +1,74 @@
+from typing import Generic, Iterable, List, Set, TypeVar
+
+from ipm.typing import Dict
+
+T = TypeVar("T")
+
+
+class DependencyGraph(Generic[T]):
+    """规则包依赖图, 遍历均以显式栈实现, 不受递归深度限制"""
+
+    def __init__(self) -> None:
+        self.nodes: Dict[str, T] = {}
+        self.edges: Dict[str, List[str]] = {}
+
+    def add(self, name: str, node: T, dependencies: Iterable[str] = ()) -> None:
+        self.nodes[name] = node
+        self.edges[name] = list(dict.fromkeys(dependencies))
+
+    def components(self) -> List[List[str]]:
+        """强连通分量 (Tarjan), 被依赖的分量总是排在依赖它的分量之前"""
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        res = []
+
+        def visit(name: str) -> None:
+            index[name] = lowlink[name] = len(index)
+            stack.append(name)
+            on_stack.add(name)
+            work.append((name, iter(self.edges.get(name, ()))))
+
+        for root in self.nodes:
+            if root in index:
+                continue
+            work = []
+            visit(root)
+            while work:
+                name, dependencies = work[-1]
+                for dependency in dependencies:
+                    if dependency not in self.nodes:
+                        continue
+                    if dependency not in index:
+                        visit(dependency)
+                        break
+                    if dependency in on_stack:
+                        lowlink[name] = min(lowlink[name], index[dependency])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[name])
+                    if lowlink[name] == index[name]:
+                        component = []
+                        while True:
+                            node = stack.pop()
+                            on_stack.discard(node)
+                            component.append(node)
+                            if node == name:
+                                break
+                        res.append(component[::-1])
+        return res
+
+    def order(self) -> List[str]:
+        """拓扑顺序, 依赖排在前面, 同一循环依赖中的规则包相邻排列"""
+        return [name for component in self.components() for name in component]
+
+    def cycles(self) -> List[List[str]]:
+        """图中的全部循环依赖"""
+        return [
+            component
+            for component in self.components()
+            if len(component) > 1 or component[0] in self.edges[component[0]]
+        ]
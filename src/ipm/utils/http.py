@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from requests.adapters import HTTPAdapter
+from ipm.const import HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_TIMEOUT
+from ipm.exceptions import OfflineError
+
+import threading
+import requests
+
+_offline = False
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """进程内共享的连接池, 对同一世界树的请求复用保持活动的连接"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_SIZE,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=HTTP_RETRIES,
+                )
+                _session.mount("http://", adapter)
+                _session.mount("https://", adapter)
+    return _session
+
+
+def close() -> None:
+    """关闭共享连接池中的全部连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """通过共享连接池发起 GET 请求, 离线模式下直接失败"""
+    if _offline:
+        raise OfflineError(f"离线模式下无法访问 [red]{url}[/red].")
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session().get(url, **kwargs)
+
+
+def is_offline() -> bool:
+    return _offline
+
+
+@contextmanager
+def offline_mode(enabled: bool = True) -> Iterator[None]:
+    """在上下文中禁止一切网络访问"""
+    global _offline
+    previous, _offline = _offline, _offline or enabled
+    try:
+        yield
+    finally:
+        _offline = previous
@@ -0,0 +1,111 @@
+from codecs import getincrementaldecoder
+from json import JSONDecodeError, JSONDecoder
+from typing import Any, Iterable, Iterator, Optional, Sequence, Tuple
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+
+_decoder = JSONDecoder()
+
+
+class Reader:
+    """按需读入数据块的 JSON 文本缓冲区"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = 1) -> bool:
+        """读入至少 `size` 个字符, 已读到结尾时返回假"""
+        texts = []
+        while not self.eof and size > 0:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.eof = True
+                text = self._decoder.decode(b"", final=True)
+            else:
+                text = self._decoder.decode(chunk)
+            texts.append(text)
+            size -= len(text)
+        if not any(texts):
+            return False
+        # 丢弃已解析的部分, 缓冲区大小只与单个值的大小有关
+        self.buffer = self.buffer[self.pos :] + "".join(texts)
+        self.pos = 0
+        return True
+
+    def error(self, message: str) -> JSONDecodeError:
+        return JSONDecodeError(message, self.buffer, self.pos)
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符, 已读到结尾时返回空字符串"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        if not self.peek():
+            raise self.error("Expecting value")
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except JSONDecodeError:
+                # 值尚未读完整, 成倍扩大缓冲区以避免反复解析
+                if self.fill(len(self.buffer) - self.pos):
+                    continue
+                raise
+            # 位于缓冲区末尾的数字可能被截断
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def keys(self) -> Iterator[str]:
+        """逐个读取对象的键, 调用方需在迭代间读取对应的值"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if not isinstance(key := self.value(), str):
+                raise self.error("Expecting property name")
+            self.expect(":")
+            yield key
+            if (char := self.peek()) == "}":
+                self.pos += 1
+                return
+            if char != ",":
+                raise self.error("Expecting ',' delimiter")
+            self.pos += 1
+
+
+def iter_items(
+    chunks: Iterable[bytes], nested: Sequence[str] = ()
+) -> Iterator[Tuple[Optional[str], str, Any]]:
+    """流式解析 JSON 对象, 逐个产出 `(父键, 键, 值)`
+
+    顶层键值对的父键为 `None`; `nested` 中的键所对应的对象会被展开,
+    其中的键值对逐个产出, 内存占用只与其中最大的单个值有关.
+    """
+    reader = Reader(chunks)
+    for key in reader.keys():
+        if key in nested and reader.peek() == "{":
+            for name in reader.keys():
+                yield key, name, reader.value()
+        else:
+            yield None, key, reader.value()
+    if reader.peek():
+        raise reader.error("Extra data")
@@ -1,37 +1,74 @@
 from pathlib import Path
+from typing import Optional
 from ipm.utils.freeze import extract_ipk
-from ipm.const import STORAGE
+from ipm.const import DOWNLOAD_CHUNK_SIZE, STORAGE
+from ipm.exceptions import FileNotFoundError, VerifyFailed
 from ipm.models.ipk import InfiniFrozenPackage
+from ipm.utils import fs, http
+from ipm.utils.fs import FileLock, copy_atomic
+from ipm.utils.hash import ifp_verify
 
-import requests
 import tempfile
-import shutil
+import tarfile
+import tomlkit
+import hashlib
+import os
 
 
-def load_from_remote(name: str, url, hash: str) -> InfiniFrozenPackage:
-    ipk_bytes = requests.get(url).content
-
-    temp_dir = tempfile.TemporaryDirectory()
-    temp_path = Path(temp_dir.name).resolve()
-
-    ipk_path = temp_path / f"{name}.ipk"
-    ipk_file = ipk_path.open("w+b")
-    ipk_file.write(ipk_bytes)
-    ipk_file.close()
-
-    temp_ipk = extract_ipk(ipk_path, temp_path, hash=hash)
-    if not temp_ipk:
-        raise RuntimeError("解压时出现异常.")
+def load_from_remote(
+    name: str, url, hash: str, version: Optional[str] = None
+) -> InfiniFrozenPackage:
+    """边下载边校验, 数据分块写入存储目录下的临时文件, 校验通过后原子重命名
 
+    未给出版本号时从规则包内的 `infini.toml` 读取, 无需解压整个规则包.
+    """
     STORAGE.mkdir(parents=True, exist_ok=True)
-    move_to = STORAGE.joinpath(temp_ipk.default_name + ".ipk")
-
-    shutil.copy2(ipk_path, move_to)
-
-    ifp = InfiniFrozenPackage(move_to, name=temp_ipk.name, version=temp_ipk.version)
-
-    temp_dir.cleanup()
-    return ifp
+    partial_path = fs.temp_path(STORAGE.joinpath(f"{name}.ipk"))
+    sha256 = hashlib.sha256()
+    try:
+        with http.get(url, stream=True) as response:
+            if not response.ok:
+                raise FileNotFoundError(
+                    f"规则包 [red]{name}[/red] 下载失败: HTTP {response.status_code}."
+                )
+            with partial_path.open("wb") as file:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    file.write(chunk)
+        if hash and sha256.hexdigest() != hash:
+            raise VerifyFailed("文件完整性验证失败!")
+        version = version or read_version(partial_path)
+        move_to = STORAGE.joinpath(f"{name}-{version}.ipk")
+        os.replace(partial_path, move_to)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+
+    return InfiniFrozenPackage(move_to, name=name, version=version)
+
+
+def read_version(ipk_path: Path) -> str:
+    """只读取规则包中的 `infini.toml` 以获得版本号"""
+    try:
+        with tarfile.open(ipk_path, "r:gz") as tar:
+            for member in tar:
+                if member.isfile() and Path(member.name).name == "infini.toml":
+                    return tomlkit.loads(
+                        tar.extractfile(member).read().decode("utf-8")  # type: ignore
+                    )["project"]["version"]
+    except (tarfile.TarError, KeyError) as error:
+        raise RuntimeError("解压时出现异常.") from error
+    raise RuntimeError("解压时出现异常.")
+
+
+def load_from_storage(
+    name: str, version: str, hash: str
+) -> Optional[InfiniFrozenPackage]:
+    """按哈希校验本地存储中已有的规则包, 无需访问世界树"""
+    path = STORAGE.joinpath(f"{name}-{version}.ipk")
+    if not hash or not path.is_file() or not ifp_verify(path, hash):
+        return None
+    return InfiniFrozenPackage(path, name=name, version=version)
 
 
 def load_from_local(source_path: Path) -> InfiniFrozenPackage:
@@ -44,8 +81,12 @@ def load_from_local(source_path: Path) -> InfiniFrozenPackage:
     move_to = STORAGE / temp_ipk.name
     move_to.mkdir(parents=True, exist_ok=True)
 
-    shutil.copy2(source_path, move_to)
-    shutil.copy2(source_path.parent / (source_path.name + ".hash"), move_to)
+    with FileLock(move_to):
+        copy_atomic(source_path, move_to / source_path.name)
+        copy_atomic(
+            source_path.parent / (source_path.name + ".hash"),
+            move_to / (source_path.name + ".hash"),
+        )
 
     ifp = InfiniFrozenPackage(
         move_to.joinpath(temp_ipk.default_name + ".ipk"),
@@ -0,0 +1,180 @@
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import IO, Any, Iterator, NamedTuple, Optional, Tuple
+
+from ipm.const import DOWNLOAD_CHUNK_SIZE, STORAGE
+from ipm.models.index import PACKAGES_FILE, Yggdrasil
+from ipm.models.lock import PackageLock
+from ipm.typing import Dict
+from ipm.utils import compress, http
+from ipm.utils.hash import ifp_hash, ifp_verify
+from ipm.utils.registry import FileRegistry
+
+import shutil
+import os
+
+MIRROR_COMPRESSION = "gz"
+
+
+class Snapshot(NamedTuple):
+    """世界树快照的统计信息"""
+
+    packages: int
+    distributions: int
+    missing: int
+
+
+def snapshot(yggdrasil: Yggdrasil, dist: Path, fetch: bool = False) -> Snapshot:
+    """将世界树索引与本地存储中的发行包快照到 `dist`
+
+    快照目录与世界树的布局一致, 可直接作为静态世界树使用.
+    稀疏索引仅包含已拉取的规则包; `fetch` 为真时本地缺失的发行包会从世界树下载.
+    """
+    json_path = dist.joinpath("json")
+    json_path.mkdir(parents=True, exist_ok=True)
+    global_lock = PackageLock.load()
+    # 镜像使用独立的标识, 与上游同时配置时在全局包锁中互不覆盖
+    metadata = dict(
+        yggdrasil.metadata,
+        uuid=mirror_uuid(yggdrasil.uuid),
+        upstream_uuid=yggdrasil.uuid,
+        compressions=[MIRROR_COMPRESSION],
+    )
+    metadata.pop("sparse", None)
+    counts = {"packages": 0, "distributions": 0, "missing": 0}
+
+    def packages() -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for name, package in yggdrasil.iter_packages():
+            counts["packages"] += 1
+            for distribution in package.get("distributions", []):
+                if copy_distribution(
+                    yggdrasil, global_lock, name, distribution, dist, fetch
+                ):
+                    counts["distributions"] += 1
+                else:
+                    counts["missing"] += 1
+            yield name, package
+
+    packages_path = json_path.joinpath(PACKAGES_FILE)
+    temp_path = packages_path.with_name(packages_path.name + ".tmp")
+    with temp_path.open("wb") as file:
+        Yggdrasil.write_packages(file, packages(), {"metadata": metadata})
+    os.replace(temp_path, packages_path)
+    precompress(packages_path)
+    return Snapshot(**counts)
+
+
+def mirror_uuid(upstream_uuid: str) -> str:
+    """由上游世界树标识派生的镜像标识"""
+    return f"{upstream_uuid}-mirror"
+
+
+def precompress(path: Path) -> None:
+    """生成预压缩文件, 同时用于 `Accept-Encoding` 协商"""
+    compressed_path = path.with_name(compress.filename(path.name, MIRROR_COMPRESSION))
+    temp_path = compressed_path.with_name(compressed_path.name + ".tmp")
+    with path.open("rb") as source, compress.open_file(
+        temp_path, "wb", MIRROR_COMPRESSION
+    ) as target:
+        shutil.copyfileobj(source, target)
+    os.replace(temp_path, compressed_path)
+
+
+def copy_distribution(
+    yggdrasil: Yggdrasil,
+    global_lock: PackageLock,
+    name: str,
+    distribution: Dict[str, Any],
+    dist: Path,
+    fetch: bool = False,
+) -> bool:
+    """将发行包复制到快照目录中其下载地址对应的位置, 返回快照中是否有该发行包"""
+    url, hash = distribution["download_url"], distribution.get("hash")
+    if "://" in url:
+        return False
+    target = dist.joinpath(url.lstrip("/")).resolve()
+    if dist.resolve() not in target.parents:
+        return False
+    if target.is_file() and (not hash or ifp_verify(target, hash)):
+        return True
+
+    source = global_lock.get_frozen_package_path(
+        name, distribution["version"]
+    ) or STORAGE.joinpath(f"{name}-{distribution['version']}.ipk")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(target.name + ".tmp")
+    if source.is_file() and (not hash or ifp_verify(source, hash)):
+        shutil.copy2(source, temp_path)
+    elif fetch:
+        response = http.get(yggdrasil.index.rstrip("/") + url, stream=True)
+        if not response.ok:
+            response.close()
+            return False
+        with response, temp_path.open("wb") as file:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+        if hash and not ifp_verify(temp_path, hash):
+            temp_path.unlink()
+            return False
+    else:
+        return False
+    os.replace(temp_path, target)
+    return True
+
+
+class MirrorHandler(SimpleHTTPRequestHandler):
+    """带 ETag 与 gzip 协商的静态世界树服务"""
+
+    _etags: FileRegistry[str] = FileRegistry()
+
+    def etag(self, path: Path) -> str:
+        return '"%s"' % self._etags.get(path, (path,), lambda: ifp_hash(path))
+
+    def send_head(self) -> Optional[IO[bytes]]:
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            return super().send_head()
+
+        content_type = self.guess_type(str(path))
+        encoding = None
+        compressed_path = path.with_name(compress.filename(path.name, "gz"))
+        if (
+            "gzip" in self.headers.get("Accept-Encoding", "")
+            and compressed_path.is_file()
+        ):
+            path, encoding = compressed_path, "gzip"
+
+        etag = self.etag(path)
+        if etag in (
+            tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")
+        ):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        file = path.open("rb")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.fstat(file.fileno()).st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        return file
+
+
+def serve(dist: Path, host: str = "0.0.0.0", port: int = 8000) -> None:
+    """以 HTTP 服务快照目录, 直到被中断"""
+    server = ThreadingHTTPServer(
+        (host, port), partial(MirrorHandler, directory=str(dist))
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+from ipm.typing import Dict
+
+T = TypeVar("T")
+Stamp = Tuple[Optional[Tuple[int, int]], ...]
+
+
+def stamp(*paths: Path) -> Stamp:
+    """以文件修改时间与大小标识文件状态, 文件不存在时为 `None`"""
+    res = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            res.append(None)
+        else:
+            res.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(res)
+
+
+class FileRegistry(Generic[T]):
+    """进程内共享的文件解析结果缓存
+
+    同一文件在未被修改时只会被解析一次, 文件的修改时间或大小变化后重新解析.
+    被新对象取代的旧对象会交给 `dispose` 释放资源.
+    """
+
+    def __init__(self, dispose: Optional[Callable[[T], None]] = None) -> None:
+        self._entries: Dict[Hashable, Tuple[Stamp, T]] = {}
+        self._dispose = dispose
+
+    def get(
+        self, key: Hashable, paths: Tuple[Path, ...], factory: Callable[[], T]
+    ) -> T:
+        current = stamp(*paths)
+        if (entry := self._entries.get(key)) and entry[0] == current:
+            return entry[1]
+        value = factory()
+        self._set(key, current, value)
+        return value
+
+    def update(self, key: Hashable, paths: Tuple[Path, ...], value: T) -> None:
+        """在写入文件后登记最新的对象, 避免下次读取时重复解析"""
+        self._set(key, stamp(*paths), value)
+
+    def _set(self, key: Hashable, current: Stamp, value: T) -> None:
+        entry = self._entries.get(key)
+        self._entries[key] = (current, value)
+        if entry and entry[1] is not value and self._dispose:
+            self._dispose(entry[1])
@@ -1,30 +1,293 @@
-from typing import List
-from ipm.models.index import Yggdrasil
+from typing import Any, Iterable, List, NamedTuple, Optional, Set, Tuple
+from ipm.const import INDEX
+from ipm.exceptions import ProjectError, ResolutionError
+from ipm.models.index import Distribution, Yggdrasil
 from ipm.models.ipk import InfiniProject
+from ipm.models.lock import PackageLock
 from ipm.models.requirement import Requirement
+from ipm.typing import Dict
+from ipm.utils.cache import ResolveCache
+from ipm.utils.graph import DependencyGraph
+from ipm.utils.version import SpecifierSet, Version
 
 
-def get_requirements(
-    requirement: Requirement, resolved: List[str] = []
-) -> List[Requirement]:
-    requirements = {}
-    for req in requirement.yggdrasil.get_requirements(requirement.name):
-        if req.name in resolved:
-            continue
-        resolved.append(req.name)
-        requirements[req.name] = req
-        sub_reqs = get_requirements(req, resolved)
-        for sub_seq in sub_reqs:
-            requirements[sub_seq.name] = sub_seq
-
-    return list(requirements.values())
-
-
-def get_requirements_by_project(project: InfiniProject) -> List[Requirement]:
-    requirements = {}
-    for requirement in project.requirements:
-        requirements[requirement.name] = requirement
-        reqs = get_requirements(requirement)
-        for req in reqs:
-            requirements[req.name] = req
-    return list(requirements.values())
+class Term(NamedTuple):
+    """对规则包版本的约束, 根依赖的 `parent` 为 `None`"""
+
+    name: str
+    constraint: str
+    yggdrasil: Yggdrasil
+    parent: Optional[str] = None
+    url: Optional[str] = None
+    path: Optional[str] = None
+
+
+class Decision:
+    """为一个规则包选择版本的回溯点"""
+
+    __slots__ = ("name", "candidates", "index", "mark", "conflicts")
+
+    def __init__(self, name: str, candidates: List[Distribution], mark: int) -> None:
+        self.name = name
+        self.candidates = candidates
+        self.index = 0
+        self.mark = mark
+        self.conflicts: Set[str] = set()
+
+
+class Resolver:
+    """带冲突回跳的回溯依赖解析器
+
+    按发现顺序为每个规则包选择满足全部约束的最新版本; 没有可选版本时,
+    回跳到引入冲突约束的最近一次选择并尝试其下一个候选版本.
+    """
+
+    def __init__(self) -> None:
+        self._candidates: Dict[Tuple[str, str], List[Distribution]] = {}
+        self._dependencies: Dict[Tuple[str, str, str], List[Term]] = {}
+
+    def prefetch(self, yggdrasil: Yggdrasil, names: Iterable[str]) -> None:
+        """批量载入尚未缓存的规则包发行版, 由新到旧排列"""
+        if names := [
+            name for name in names if (yggdrasil.index, name) not in self._candidates
+        ]:
+            for name, distributions in yggdrasil.lookup(names).items():
+                self._candidates[(yggdrasil.index, name)] = sorted(
+                    distributions.values(),
+                    key=lambda distribution: Version(distribution.version).key,
+                    reverse=True,
+                )
+
+    def candidates(self, yggdrasil: Yggdrasil, name: str) -> List[Distribution]:
+        """规则包的全部发行版, 由新到旧排列, 每个规则包只排序一次"""
+        self.prefetch(yggdrasil, (name,))
+        return self._candidates[(yggdrasil.index, name)]
+
+    def dependencies(self, yggdrasil: Yggdrasil, name: str, version: str) -> List[Term]:
+        key = (yggdrasil.index, name, version)
+        if (res := self._dependencies.get(key)) is None:
+            res = self._dependencies[key] = [
+                Term(
+                    requirement["name"],
+                    requirement.get("version") or "*",
+                    yggdrasil,
+                    parent=name,
+                    url=requirement.get("url"),
+                )
+                for requirement in yggdrasil.get_dependencies(name, version)
+            ]
+            # 同一版本的依赖一并查询, 不必逐个规则包访问索引
+            self.prefetch(yggdrasil, (term.name for term in res))
+        return res
+
+    def resolve(self, terms: List[Term]) -> DependencyGraph[Requirement]:
+        constraints: Dict[str, List[Term]] = {}
+        pinned: Dict[str, Tuple[Yggdrasil, Distribution]] = {}
+        fixed: Dict[str, Requirement] = {}
+        # 撤销日志: `(规则包, 约束)`, 约束为 `None` 时表示一次版本选择
+        trail: List[Tuple[str, Optional[Term]]] = []
+        decisions: List[Decision] = []
+
+        def add(term: Term) -> None:
+            constraints.setdefault(term.name, []).append(term)
+            trail.append((term.name, term))
+
+        def undo(mark: int) -> None:
+            while len(trail) > mark:
+                name, term = trail.pop()
+                if term is None:
+                    del pinned[name]
+                    continue
+                constraints[name].pop()
+                if not constraints[name]:
+                    del constraints[name]
+
+        def advance(decision: Decision) -> bool:
+            """尝试下一个候选版本, 候选版本耗尽时返回假"""
+            while decision.index < len(decision.candidates):
+                distribution = decision.candidates[decision.index]
+                decision.index += 1
+                undo(decision.mark)
+                yggdrasil = constraints[decision.name][0].yggdrasil
+                pinned[decision.name] = (yggdrasil, distribution)
+                trail.append((decision.name, None))
+                for term in self.dependencies(
+                    yggdrasil, decision.name, distribution.version
+                ):
+                    add(term)
+                    if (
+                        term.name in pinned
+                        and term.name not in fixed
+                        and not SpecifierSet(term.constraint).contains(
+                            pinned[term.name][1].version
+                        )
+                    ):
+                        decision.conflicts.add(term.name)
+                        break
+                else:
+                    return True
+            undo(decision.mark)
+            return False
+
+        # 根依赖按世界树分组后批量查询
+        roots: Dict[str, Tuple[Yggdrasil, List[str]]] = {}
+        for term in terms:
+            if not (term.path or term.url):
+                roots.setdefault(term.yggdrasil.index, (term.yggdrasil, []))[1].append(
+                    term.name
+                )
+        for yggdrasil, names in roots.values():
+            self.prefetch(yggdrasil, names)
+
+        for term in terms:
+            if term.path or term.url:
+                # 指定了本地路径或下载地址的依赖不参与版本选择
+                fixed[term.name] = Requirement(
+                    term.name,
+                    term.constraint,
+                    url=term.url,
+                    path=term.path,
+                    yggdrasil=term.yggdrasil,
+                )
+                if not term.path:
+                    for dependency in self.dependencies(
+                        term.yggdrasil, term.name, term.constraint
+                    ):
+                        add(dependency)
+            else:
+                add(term)
+
+        while name := next(
+            (name for name in constraints if name not in pinned and name not in fixed),
+            None,
+        ):
+            specifiers = [SpecifierSet(term.constraint) for term in constraints[name]]
+            decision = Decision(
+                name,
+                [
+                    distribution
+                    for distribution in self.candidates(
+                        constraints[name][0].yggdrasil, name
+                    )
+                    if all(
+                        specifier.contains(distribution.version)
+                        for specifier in specifiers
+                    )
+                ],
+                len(trail),
+            )
+            decisions.append(decision)
+            while not advance(decision):
+                failed = list(constraints[decision.name])
+                conflicts = decision.conflicts | {
+                    term.parent for term in failed if term.parent is not None
+                }
+                decisions.pop()
+                while decisions and decisions[-1].name not in conflicts:
+                    undo(decisions.pop().mark)
+                if not decisions:
+                    raise ResolutionError(
+                        f"无法为规则包 [bold red]{decision.name}[/] 找到满足约束的版本: "
+                        + ", ".join(
+                            f"{term.parent or '项目'} 要求 {term.constraint}"
+                            for term in failed
+                        )
+                    )
+                decision = decisions[-1]
+                decision.conflicts |= conflicts - {decision.name}
+
+        graph: DependencyGraph[Requirement] = DependencyGraph()
+        for name, requirement in fixed.items():
+            graph.add(
+                name,
+                requirement,
+                (
+                    ()
+                    if requirement.is_local()
+                    else (
+                        term.name
+                        for term in self.dependencies(
+                            requirement.yggdrasil, name, requirement.version
+                        )
+                    )
+                ),
+            )
+        for name, (yggdrasil, distribution) in pinned.items():
+            graph.add(
+                name,
+                Requirement(
+                    name,
+                    distribution.version,
+                    url=distribution.url,
+                    yggdrasil=yggdrasil,
+                    hash=distribution.hash,
+                ),
+                (
+                    term.name
+                    for term in self.dependencies(yggdrasil, name, distribution.version)
+                ),
+            )
+        return graph
+
+
+def get_terms_by_project(project: InfiniProject) -> List[Term]:
+    """读取项目直接声明的依赖约束"""
+    global_lock = PackageLock.load()
+    yggdrasils = project.yggdrasils
+    terms = []
+    for name, requirement in project.data.get("requirements", {}).items():
+        if isinstance(requirement, str):
+            requirement = {"version": requirement}
+        yggdrasil = None
+        for key, value in requirement.items():
+            if key == "index":
+                yggdrasil = global_lock.get_yggdrasil_by_index(value)
+            elif key == "yggdrasil":
+                if value not in yggdrasils or not (
+                    yggdrasil := global_lock.get_yggdrasil_by_index(yggdrasils[value])
+                ):
+                    raise ValueError(f"未知的世界树标识符: '{value}'")
+            elif key not in ("url", "path", "version"):
+                raise ValueError(f"未知的依赖项键值: '{key}'")
+        if not (yggdrasil := yggdrasil or global_lock.get_yggdrasil_by_index(INDEX)):
+            raise ProjectError("未能找到任何世界树地址，请先添加一个世界树地址。")
+        terms.append(
+            Term(
+                name,
+                requirement.get("version") or "*",
+                yggdrasil,
+                url=requirement.get("url"),
+                path=requirement.get("path"),
+            )
+        )
+    return terms
+
+
+def get_inputs_by_project(project: InfiniProject) -> Dict[str, Any]:
+    """影响依赖解析结果的全部输入: 依赖声明与所用世界树的标识及版本"""
+    global_lock = PackageLock.load()
+    indexes = {}
+    for index in sorted(set(project.yggdrasils.values())):
+        uuid = global_lock.get_uuid_by_index(index)
+        indexes[index] = [uuid, Yggdrasil.revision(uuid) if uuid else None]
+    return {
+        "requirements": project.data.get("requirements", {}),
+        "yggdrasils": project.yggdrasils,
+        "indexes": indexes,
+    }
+
+
+def resolve_project(project: InfiniProject) -> List[Dict[str, Any]]:
+    """解析项目依赖为锁文件条目, 输入相同时直接读取磁盘缓存的结果"""
+    cache = ResolveCache()
+    key = ResolveCache.key(get_inputs_by_project(project))
+    if (packages := cache.get(key)) is None:
+        graph = Resolver().resolve(get_terms_by_project(project))
+        packages = []
+        for name in graph.order():
+            package = graph.nodes[name].as_dict()
+            if graph.edges[name]:
+                package["dependencies"] = graph.edges[name]
+            packages.append(package)
+        cache.put(key, packages)
+    return packages
@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import Any, Optional
+from tomlkit import TOMLDocument
+
+from ipm.typing import Dict
+from ipm.utils.registry import Stamp, stamp
+
+import tomlkit
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+def load(path: Path) -> Dict[str, Any]:
+    """只读解析 TOML 文件为普通字典, 未安装 `tomli` 时回退到 tomlkit"""
+    if not path.exists():
+        return {}
+    if tomllib is None:
+        with path.open("r", encoding="utf-8") as file:
+            return tomlkit.load(file).unwrap()
+    with path.open("rb") as file:
+        return tomllib.load(file)
+
+
+class TomlFile:
+    """按需选择解析方式的 TOML 文件
+
+    只读访问 `data` 时以 `tomllib` 快速解析为普通字典;
+    首次访问 `_data` 时才以 tomlkit 解析为可修改并保留格式的文档.
+    """
+
+    _toml_path: Path
+    _plain: Optional[Dict[str, Any]] = None
+    _document: Optional[TOMLDocument] = None
+    _stamp: Stamp = ()
+
+    def read(self) -> TOMLDocument:
+        if not self._toml_path.exists():
+            return tomlkit.document()
+        with self._toml_path.open("r", encoding="utf-8") as file:
+            return tomlkit.load(file)
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """只读的普通字典"""
+        if self._document is not None:
+            return self._document.unwrap()
+        if self._plain is None:
+            self._stamp = stamp(self._toml_path)
+            self._plain = load(self._toml_path)
+        return self._plain
+
+    @property
+    def _data(self) -> TOMLDocument:
+        """可修改并写回的文档"""
+        if self._document is None:
+            self._stamp = stamp(self._toml_path)
+            self._document = self.read()
+            self._plain = None
+            self.loaded()
+        return self._document
+
+    @_data.setter
+    def _data(self, document: TOMLDocument) -> None:
+        self._stamp = stamp(self._toml_path)
+        self._document = document
+        self._plain = None
+        self.loaded()
+
+    @property
+    def stale(self) -> bool:
+        """文件在读取后是否被其他进程修改"""
+        return stamp(self._toml_path) != self._stamp
+
+    def reload(self) -> None:
+        self._plain = None
+        self._document = None
+        self.loaded()
+
+    def loaded(self) -> None:
+        """数据来源变化后调用"""
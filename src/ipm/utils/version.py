@@ -1,52 +1,194 @@
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from ipm.typing import Dict
+
+import operator
 import re
 
+VERSION = re.compile(
+    r"^\s*v?(\d+)(?:\.(\d+))?(?:\.(\d+))?"
+    r"(?:[-.]?([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?\s*$"
+)
+IDENTIFIER_PART = re.compile(r"\d+|\D+")
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+SPECIFIER = re.compile(r"^\s*(==|!=|>=|<=|~=|>|<|\^)?\s*([^\s,]+)\s*$")
+
+
+class Version:
+    """语义化版本号
+
+    相同文本只解析一次并返回同一对象, 排序键在解析时预先计算.
+    预发布标识按语义化版本规范比较, `a10` 等字母与数字混合的标识按数值比较数字部分;
+    无法解析的版本号排在所有合法版本号之前, 彼此按文本比较.
+    """
+
+    __slots__ = ("text", "release", "prerelease", "build", "key")
+    _interned: Dict[str, "Version"] = {}
+
+    text: str
+    release: Tuple[int, int, int]
+    prerelease: Tuple[str, ...]
+    build: Optional[str]
+    key: Tuple[Any, ...]
+
+    def __new__(cls, text: str) -> "Version":
+        if (version := cls._interned.get(text)) is not None:
+            return version
+        version = super().__new__(cls)
+        version.text = text
+        if match := VERSION.match(text):
+            major, minor, patch, prerelease, version.build = match.groups()
+            version.release = (int(major), int(minor or 0), int(patch or 0))
+            version.prerelease = tuple(prerelease.split(".")) if prerelease else ()
+            version.key = (
+                1,
+                version.release,
+                not version.prerelease,
+                tuple(map(Version.identifier_key, version.prerelease)),
+            )
+        else:
+            version.release, version.prerelease, version.build = (0, 0, 0), (), None
+            version.key = (0, text)
+        cls._interned[text] = version
+        return version
+
+    @staticmethod
+    def identifier_key(identifier: str) -> Tuple[Any, ...]:
+        if identifier.isdigit():
+            return (0, int(identifier))
+        return (
+            1,
+            tuple(
+                (0, int(part)) if part.isdigit() else (1, part)
+                for part in IDENTIFIER_PART.findall(identifier)
+            ),
+        )
+
+    @property
+    def valid(self) -> bool:
+        return self.key[0] == 1
+
+    def __repr__(self) -> str:
+        return f"Version({self.text!r})"
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Version) and self.key == other.key
+
+    def __lt__(self, other: "Version") -> bool:
+        return self.key < other.key
+
+    def __le__(self, other: "Version") -> bool:
+        return self.key <= other.key
+
+    def __gt__(self, other: "Version") -> bool:
+        return self.key > other.key
+
+    def __ge__(self, other: "Version") -> bool:
+        return self.key >= other.key
+
+
+class SpecifierSet:
+    """编译后的版本约束
+
+    支持 `==`, `!=`, `>=`, `<=`, `>`, `<`, `~=`, `^` 与以逗号连接的多个约束,
+    `*` 与空约束匹配任意版本. 相同文本只编译一次, 匹配时直接比较预先计算的排序键.
+    """
+
+    __slots__ = ("text", "clauses")
+    _interned: Dict[str, "SpecifierSet"] = {}
+
+    text: str
+    clauses: List[Tuple[Callable[[Any, Any], bool], str, Tuple[Any, ...]]]
+
+    def __new__(cls, text: str) -> "SpecifierSet":
+        if (specifier := cls._interned.get(text)) is not None:
+            return specifier
+        specifier = super().__new__(cls)
+        specifier.text = text
+        specifier.clauses = []
+        if text.strip() not in ("", "*"):
+            for part in text.split(","):
+                if not (match := SPECIFIER.match(part)) or (
+                    # 省略运算符时须为合法版本号, 避免 `=>1.0.0` 等笔误被当作精确版本
+                    match.group(1) is None
+                    and not Version(match.group(2)).valid
+                ):
+                    raise ValueError(f"无效的版本约束: '{text}'")
+                specifier.compile(match.group(1) or "==", match.group(2))
+        cls._interned[text] = specifier
+        return specifier
+
+    def compile(self, op: str, target: str) -> None:
+        version = Version(target)
+        if op not in ("==", "!=") and not version.valid:
+            raise ValueError(f"无效的版本约束: '{self.text}'")
+        if op == "<" and not version.prerelease:
+            # 与 `~=` 和 `^` 的上界一致, `<1.0.0` 不包含 1.0.0 的预发布版本
+            self.clauses.append((operator.lt, target, (1, version.release, False, ())))
+            return
+        if op not in ("~=", "^"):
+            self.clauses.append((OPERATORS[op], target, version.key))
+            return
+        major, minor, patch = version.release
+        if op == "^":
+            upper = (
+                (major + 1, 0, 0)
+                if major
+                else (0, minor + 1, 0) if minor else (0, 0, patch + 1)
+            )
+        elif VERSION.match(target).group(3) is not None:  # type: ignore
+            upper = (major, minor + 1, 0)
+        else:
+            upper = (major + 1, 0, 0)
+        self.clauses.append((operator.ge, target, version.key))
+        # 上界取该版本号的最小预发布版本, 使上界的预发布版本同样被排除
+        self.clauses.append((operator.lt, "", (1, upper, False, ())))
+
+    @property
+    def exact(self) -> Optional[str]:
+        """约束为单个 `==` 时返回对应的版本号"""
+        if len(self.clauses) == 1 and self.clauses[0][0] is operator.eq:
+            return self.clauses[0][1]
+        return None
+
+    def contains(self, version: str) -> bool:
+        parsed = Version(version)
+        if not parsed.valid:
+            # 无法解析的版本号只能被精确匹配
+            return all(
+                op(version, target) if op in (operator.eq, operator.ne) else False
+                for op, target, _ in self.clauses
+            )
+        return all(op(parsed.key, key) for op, _, key in self.clauses)
+
+    def filter(self, versions: Iterable[str]) -> List[str]:
+        return [version for version in versions if self.contains(version)]
+
+    def best(self, versions: Iterable[str]) -> Optional[str]:
+        """满足约束的最新版本"""
+        return max(self.filter(versions), key=Version, default=None)
+
+    def __repr__(self) -> str:
+        return f"SpecifierSet({self.text!r})"
+
+    def __str__(self) -> str:
+        return self.text
+
 
 def require_update(old_version: str, new_version: str) -> bool:
-    regex = r"^(\d+)\.(\d+)\.(\d+)(.*?)?(\d+?)?$"
-
-    old_tuple = re.match(regex, old_version)
-    new_tuple = re.match(regex, new_version)
-    if not old_tuple or not new_tuple:
-        return False
-
-    old_tuple_main = tuple(map(int, filter(None, old_tuple.group(1, 2, 3))))
-    new_tuple_main = tuple(map(int, filter(None, new_tuple.group(1, 2, 3))))
-
-    new_length = len(list(filter(None, new_tuple.groups())))
-    old_length = len(list(filter(None, old_tuple.groups())))
-
-    if old_length == 5:
-        old_pre_release = old_tuple.group(4)[0]
-        old_pre_version = int(old_tuple.group(5))
-    elif old_length == 3:
-        old_pre_release = "s"
-        old_pre_version = 1
-    else:
-        return False
-
-    if new_length == 5:
-        new_pre_release = new_tuple.group(4)[0]
-        new_pre_version = int(new_tuple.group(5))
-    elif new_length == 3:
-        new_pre_release = "s"
-        new_pre_version = 1
-    else:
-        return False
-
-    if old_tuple_main < new_tuple_main:
-        return True
-    elif old_tuple_main > new_tuple_main:
-        return False
-    elif old_tuple_main == new_tuple_main:
-        if old_pre_release < new_pre_release:
-            return True
-        elif old_pre_release > new_pre_release:
-            return False
-        elif old_pre_release == new_pre_release:
-            if old_pre_version < new_pre_version:
-                return True
-            elif old_pre_version > new_pre_version:
-                return False
-            elif old_pre_version == new_pre_version:
-                return False
-    return False
+    old, new = Version(old_version), Version(new_version)
+    return old.valid and new.valid and new > old
@@ -0,0 +1,140 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from ipm.models import index, lock
+from ipm.utils import cache
+
+import threading
+import hashlib
+import gzip
+import json
+import pytest
+
+PACKAGES = {
+    "metadata": {"uuid": "test-yggdrasil", "revision": 1},
+    "packages": {
+        "dice": {
+            "name": "dice",
+            "description": "骰子规则包",
+            "latestVersion": "0.2.0",
+            "topics": ["trpg"],
+            "requirements": [],
+            "distributions": [
+                {"version": "0.1.0", "download_url": "/dice-0.1.0.ipk", "hash": "a"},
+                {"version": "0.2.0", "download_url": "/dice-0.2.0.ipk", "hash": "b"},
+            ],
+        },
+    },
+}
+
+
+class WorldTree:
+    def __init__(self, packages: dict) -> None:
+        self.packages = packages
+        self.deltas = {}
+        self.sparse = False
+        self.requests = []
+
+    def document(self, path: str):
+        if path == "/json/packages.json":
+            return self.packages
+        if path == "/json/packages.json.gz":
+            return (
+                self.packages if self.packages["metadata"].get("compressions") else None
+            )
+        if not self.sparse:
+            return None
+        if path == "/json/metadata.json":
+            return dict(self.packages["metadata"], sparse=True)
+        if path.startswith("/json/packages/") and path.endswith(".json"):
+            return self.packages["packages"].get(path[len("/json/packages/") : -5])
+
+    def etag(self, document) -> str:
+        content = json.dumps(document, sort_keys=True).encode()
+        return '"%s"' % hashlib.sha256(content).hexdigest()
+
+    def handler(self):
+        tree = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                tree.requests.append((self.path, dict(self.headers)))
+                if (document := tree.document(self.path)) is None:
+                    self.send_error(404)
+                    return
+                etag = tree.etag(document)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                revision = self.headers.get("X-Yggdrasil-Revision")
+                if self.headers.get("A-IM") and revision in tree.deltas:
+                    body = json.dumps(tree.deltas[revision]).encode()
+                    self.send_response(226)
+                    self.send_header("IM", self.headers["A-IM"])
+                else:
+                    body = json.dumps(document).encode()
+                    self.send_response(200)
+                if self.path.endswith(".gz"):
+                    body = gzip.compress(body)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def serve():
+    """在后台线程中启动 HTTP 服务, 返回服务地址"""
+    servers = []
+
+    def serve(handler) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return "http://127.0.0.1:%d/" % server.server_address[1]
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def make_world_tree(serve):
+    def make(uuid: str = "test-yggdrasil") -> WorldTree:
+        tree = WorldTree(json.loads(json.dumps(PACKAGES)))
+        tree.packages["metadata"]["uuid"] = uuid
+        tree.index = serve(tree.handler())
+        return tree
+
+    return make
+
+
+@pytest.fixture
+def world_tree(tmp_path, monkeypatch, make_world_tree):
+    monkeypatch.setattr(index, "INDEX_PATH", tmp_path / "index")
+    monkeypatch.setattr(lock, "IPM_PATH", tmp_path)
+    monkeypatch.setattr(cache, "RESOLVE_CACHE_PATH", tmp_path / "cache")
+    return make_world_tree()
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    """在临时目录中创建 Infini 项目, `body` 为追加到项目文件末尾的内容"""
+
+    def make(body: str = "") -> Path:
+        project_path = tmp_path / "project"
+        project_path.mkdir(exist_ok=True)
+        project_path.joinpath("infini.toml").write_text(
+            '[project]\nname = "demo"\nversion = "0.1.0"\n'
+            'description = ""\nlicense = "MIT"\n' + body,
+            encoding="utf-8",
+        )
+        return project_path
+
+    return make
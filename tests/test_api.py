@@ -1,6 +1,17 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
 from ipm import api
+from ipm.exceptions import NameError, ProjectError, ResolutionError, VerifyFailed
+from ipm.models import ipk, lock
+from ipm.models.index import Yggdrasil
+from ipm.models.ipk import InfiniFrozenPackage, InfiniProject
+from ipm.utils import loader, mirror, resolve
 
+import threading
+import hashlib
+import tarfile
 import shutil
+import pytest
 
 
 def test_new():
@@ -25,3 +36,246 @@ def test_check():
     api.new("test")
     api.check("test")
     shutil.rmtree("test", ignore_errors=True)
+
+
+def test_sync_concurrent_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(lock, "IPM_PATH", tmp_path)
+    monkeypatch.setattr(loader, "STORAGE", tmp_path / "storage")
+    monkeypatch.setattr(api.shutil, "which", lambda name: name)
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    project_path.joinpath("infini.toml").write_text(
+        '[project]\nname = "demo"\nversion = "0.1.0"\n', encoding="utf-8"
+    )
+    names = ["coc", "dice", "dnd"]
+    project_path.joinpath("infini.lock").write_text(
+        "".join(
+            f'[[package]]\nname = "{name}"\nversion = "0.1.0"\n'
+            f'yggdrasil = "https://example.org/"\nurl = "/{name}.ipk"\n'
+            f'hash = "{name}"\n'
+            for name in names
+        ),
+        encoding="utf-8",
+    )
+
+    barrier = threading.Barrier(len(names), timeout=5)
+
+    def load_from_remote(name, url, hash, version):
+        # 所有下载同时进行时才能越过屏障
+        barrier.wait()
+        ipk_path = tmp_path / f"{name}.ipk"
+        ipk_path.write_bytes(b"")
+        return InfiniFrozenPackage(ipk_path, name=name, version="0.1.0")
+
+    monkeypatch.setattr(loader, "load_from_remote", load_from_remote)
+    assert api.sync(project_path, jobs=len(names))
+    global_lock = lock.PackageLock.load()
+    for name in names:
+        assert global_lock.find_frozen_package(name, "0.1.0", name)
+
+
+def test_load_from_remote_streams_into_storage(tmp_path, monkeypatch, serve):
+    source = tmp_path / "source" / "dice-0.2.0"
+    source.mkdir(parents=True)
+    source.joinpath("infini.toml").write_text(
+        '[project]\nname = "dice"\nversion = "0.2.0"\n', encoding="utf-8"
+    )
+    source.joinpath("payload.bin").write_bytes(bytes(range(256)) * 1024)
+    served = tmp_path / "served"
+    served.mkdir()
+    with tarfile.open(served / "dice.ipk", "w:gz") as tar:
+        tar.add(source, arcname=source.name)
+    digest = hashlib.sha256(served.joinpath("dice.ipk").read_bytes()).hexdigest()
+
+    storage = tmp_path / "storage"
+    monkeypatch.setattr(loader, "STORAGE", storage)
+    monkeypatch.setattr(loader, "DOWNLOAD_CHUNK_SIZE", 1024)
+    url = serve(partial(SimpleHTTPRequestHandler, directory=str(served))) + "dice.ipk"
+    with pytest.raises(VerifyFailed):
+        loader.load_from_remote("dice", url, "0" * 64, "0.2.0")
+    assert list(storage.iterdir()) == []
+
+    ifp = loader.load_from_remote("dice", url, digest)
+    assert (ifp.name, ifp.version) == ("dice", "0.2.0")
+    assert ifp.hash == digest
+    assert [path.name for path in storage.iterdir()] == ["dice-0.2.0.ipk"]
+
+
+def test_project_lock_fingerprint(world_tree, make_project, monkeypatch):
+    Yggdrasil.init(world_tree.index)
+    project_path = make_project(
+        f'[yggdrasils]\ntest = "{world_tree.index}"\n'
+        '[requirements]\ndice = { version = "0.2.0", yggdrasil = "test" }\n'
+    )
+    assert api.lock(project_path)
+    assert not project_path.joinpath("infini.lock.lock").exists()
+    project = InfiniProject(project_path)
+    project_lock = lock.ProjectLock(project_path)
+    assert project_lock.up_to_date(project)
+    assert project_lock.packages[0].hash == "b"
+    assert project_lock.packages[0].download_url == world_tree.index + "dice-0.2.0.ipk"
+
+    def init_from_project(*args):
+        raise AssertionError("依赖不应被重新解析")
+
+    with monkeypatch.context() as context:
+        context.setattr(lock.ProjectLock, "init_from_project", init_from_project)
+        assert api.lock(project_path)
+
+    # 其他项目的相同依赖直接使用缓存的解析结果
+    project_lock._lock_path.unlink()
+    with monkeypatch.context() as context:
+        context.setattr(resolve.Resolver, "resolve", init_from_project)
+        assert api.lock(project_path)
+    assert lock.ProjectLock(project_path).packages == project_lock.packages
+
+    world_tree.packages["metadata"]["revision"] = 2
+    lock.PackageLock.load().get_yggdrasil_by_index(world_tree.index).sync()
+    assert not lock.ProjectLock(project_path).up_to_date(project)
+
+
+def test_require_rejects_unresolvable(world_tree, make_project, monkeypatch):
+    monkeypatch.setattr(ipk, "INDEX", world_tree.index)
+    world_tree.packages["packages"]["coc"] = {
+        "name": "coc",
+        "latestVersion": "0.1.0",
+        "requirements": [{"name": "dice", "version": ">=1.0.0"}],
+        "distributions": [
+            {"version": "0.1.0", "download_url": "/coc-0.1.0.ipk", "hash": "c"}
+        ],
+    }
+    Yggdrasil.init(world_tree.index)
+    project_path = make_project(
+        f'[yggdrasils]\ntest = "{world_tree.index}"\n'
+        '[requirements]\ndice = { version = "0.2.0", yggdrasil = "test" }\n'
+    )
+    content = project_path.joinpath("infini.toml").read_text(encoding="utf-8")
+
+    with pytest.raises(NameError):
+        api.require(project_path, "dice=>0.1.0", index=world_tree.index)
+    with pytest.raises(ProjectError):
+        api.require(project_path, "dice==0.9.0", index=world_tree.index)
+    # 版本存在但与已有依赖冲突时, 项目文件保持不变
+    with pytest.raises(ResolutionError):
+        api.require(project_path, "coc", index=world_tree.index)
+    assert project_path.joinpath("infini.toml").read_text(encoding="utf-8") == content
+    assert api.lock(project_path)
+
+
+def test_check_syncs_indexes_concurrently(
+    world_tree, make_world_tree, make_project, monkeypatch
+):
+    other = make_world_tree("other-yggdrasil")
+    monkeypatch.setattr(ipk, "INDEX", world_tree.index)
+    project_path = make_project(f'[yggdrasils]\nother = "{other.index}"\n')
+
+    # 两个世界树同时下载时才能越过屏障
+    barrier = threading.Barrier(2, timeout=5)
+    init = Yggdrasil.init
+
+    def concurrent_init(index: str, register: bool = True) -> Yggdrasil:
+        barrier.wait()
+        return init(index, register=register)
+
+    writes = []
+    write = lock.PackageLock.write
+
+    def counting_write(self) -> None:
+        writes.append(self)
+        write(self)
+
+    monkeypatch.setattr(Yggdrasil, "init", staticmethod(concurrent_init))
+    monkeypatch.setattr(lock.PackageLock, "write", counting_write)
+    assert api.check(project_path)
+    assert len(writes) == 1
+    global_lock = lock.PackageLock.load()
+    assert global_lock.get_uuid_by_index(world_tree.index) == "test-yggdrasil"
+    assert global_lock.get_uuid_by_index(other.index) == "other-yggdrasil"
+
+    # 仍在有效期内或离线时不访问世界树
+    requests = len(world_tree.requests), len(other.requests)
+    assert api.check(project_path)
+    for tree in (world_tree, other):
+        global_lock.get_yggdrasil_by_index(tree.index).ttl = 0
+    assert api.check(project_path, offline=True)
+    assert (len(world_tree.requests), len(other.requests)) == requests
+    assert len(writes) == 1
+
+
+def test_check_fresh_skips_index_load(world_tree, make_project, monkeypatch):
+    monkeypatch.setattr(ipk, "INDEX", world_tree.index)
+    project_path = make_project()
+    assert api.check(project_path)
+
+    # 有效期内且依赖锁未变化时, 只读取 sync.json, 不加载索引
+    def unexpected_load(index: str, uuid: str) -> Yggdrasil:
+        raise AssertionError(f"不应加载索引 {index}")
+
+    requests = len(world_tree.requests)
+    load = Yggdrasil.__dict__["load"]
+    monkeypatch.setattr(Yggdrasil, "load", staticmethod(unexpected_load))
+    assert api.check(project_path)
+    assert len(world_tree.requests) == requests
+
+    # 过期后才加载索引并同步
+    monkeypatch.setattr(Yggdrasil, "load", load)
+    global_lock = lock.PackageLock.load()
+    global_lock.get_yggdrasil_by_index(world_tree.index).ttl = 0
+    assert not Yggdrasil.is_fresh("test-yggdrasil")
+    assert api.check(project_path)
+    assert len(world_tree.requests) > requests
+
+
+def test_update_offline_sparse(world_tree, make_project, monkeypatch):
+    world_tree.sparse = True
+    monkeypatch.setattr(ipk, "INDEX", world_tree.index)
+    monkeypatch.setattr(api.shutil, "which", lambda name: name)
+    for name in ("check", "sync", "install"):
+        monkeypatch.setattr(api, name, lambda *args, **kwargs: True)
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    yggdrasil.get_package("dice")
+    project_path = make_project(
+        f'[yggdrasils]\ntest = "{world_tree.index}"\n'
+        '[requirements]\ndice = { version = "0.1.0", yggdrasil = "test" }\n'
+    )
+
+    # 世界树更新后, 已缓存的规则包在联网时需要重新验证
+    world_tree.packages["metadata"]["revision"] = 2
+    yggdrasil.sync()
+    requests = len(world_tree.requests)
+    assert api.update(project_path, offline=True)
+    assert len(world_tree.requests) == requests
+    assert InfiniProject(project_path).data["requirements"]["dice"] == {
+        "version": "0.2.0",
+        "yggdrasil": "test",
+    }
+
+
+def test_check_with_mirror_and_upstream(
+    world_tree, make_project, monkeypatch, serve, tmp_path
+):
+    monkeypatch.setattr(ipk, "INDEX", world_tree.index)
+    monkeypatch.setattr(mirror, "STORAGE", tmp_path / "storage")
+    upstream = Yggdrasil.init(world_tree.index)
+    dist = tmp_path / "mirror"
+    mirror.snapshot(upstream, dist)
+    mirror_index = serve(partial(mirror.MirrorHandler, directory=str(dist)))
+    project_path = make_project(f'[yggdrasils]\nlan = "{mirror_index}"\n')
+
+    inits = []
+    init = Yggdrasil.init
+
+    def counting_init(index: str, register: bool = True) -> Yggdrasil:
+        inits.append(index)
+        return init(index, register=register)
+
+    monkeypatch.setattr(Yggdrasil, "init", staticmethod(counting_init))
+    for _ in range(2):
+        assert api.check(project_path)
+        global_lock = lock.PackageLock.load()
+        assert global_lock.get_uuid_by_index(world_tree.index) == "test-yggdrasil"
+        assert global_lock.get_uuid_by_index(mirror_index) == "test-yggdrasil-mirror"
+    # 第二次检查时两个世界树均已登记, 无需重新下载完整索引
+    assert inits == [mirror_index]
+    lan = global_lock.get_yggdrasil_by_index(mirror_index)
+    assert lan.metadata["upstream_uuid"] == "test-yggdrasil"
@@ -0,0 +1,47 @@
+from http.server import BaseHTTPRequestHandler
+from ipm.exceptions import OfflineError
+from ipm.utils import http
+
+import pytest
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        Handler.connections.add(self.client_address)
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(serve):
+    http.close()
+    Handler.connections.clear()
+    yield serve(Handler)
+    http.close()
+
+
+def test_session_reuses_connections(server):
+    for i in range(5):
+        assert http.get(server + f"dice-0.{i}.0.ipk").content == (
+            f"/dice-0.{i}.0.ipk".encode()
+        )
+    with http.get(server + "stream", stream=True) as response:
+        assert b"".join(response.iter_content(2)) == b"/stream"
+    assert http.get(server + "json/packages.json").ok
+    assert len(Handler.connections) == 1
+    assert http.session() is http.session()
+
+
+def test_offline_mode(server):
+    with http.offline_mode(), pytest.raises(OfflineError):
+        http.get(server)
+    assert http.get(server).ok
@@ -0,0 +1,286 @@
+from functools import partial
+from ipm.exceptions import LockLoadFailed, OfflineError
+from ipm.models import index
+from ipm.models.index import Yggdrasil
+from ipm.utils import http, mirror
+
+import tracemalloc
+import os
+import io
+import json
+import hashlib
+import requests
+import pytest
+
+
+def test_sync_not_modified(world_tree):
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    assert yggdrasil.get_lastest_version("dice") == "0.2.0"
+    etag = world_tree.etag(world_tree.packages)
+    assert yggdrasil.validators["etag"] == etag
+
+    assert yggdrasil.sync() is False
+    assert world_tree.requests[-1][1]["If-None-Match"] == etag
+
+    world_tree.packages["packages"]["dice"]["latestVersion"] = "0.3.0"
+    assert yggdrasil.sync() is True
+    assert yggdrasil.get_lastest_version("dice") == "0.3.0"
+
+
+def test_sync_delta(world_tree):
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    world_tree.packages["metadata"]["revision"] = 2
+    world_tree.deltas["1"] = {
+        "metadata": {"uuid": "test-yggdrasil", "revision": 2},
+        "packages": {"coc": {"name": "coc", "latestVersion": "1.0.0"}},
+        "removed": ["dice"],
+    }
+
+    assert yggdrasil.sync() is True
+    assert world_tree.requests[-1][1]["A-IM"] == index.DELTA_IM
+    assert yggdrasil.get_lastest_version("coc") == "1.0.0"
+    assert yggdrasil.get_lastest_version("dice") is None
+    assert Yggdrasil(world_tree.index, "test-yggdrasil").packages.keys() == {"coc"}
+    assert yggdrasil.validators["revision"] == 2
+
+
+def test_sparse_index(world_tree):
+    world_tree.sparse = True
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    assert yggdrasil.sparse
+    assert yggdrasil.packages == {}
+    assert not (index.INDEX_PATH / "test-yggdrasil" / "packages.json").exists()
+
+    assert yggdrasil.get_url("dice", "0.1.0") == "/dice-0.1.0.ipk"
+    assert world_tree.requests[-1][0] == "/json/packages/dice.json"
+    assert yggdrasil.get_url("coc", None) is None
+
+    requests = len(world_tree.requests)
+    cached = Yggdrasil(world_tree.index, "test-yggdrasil")
+    assert cached.get_hash("dice", "0.2.0") == "b"
+    assert len(world_tree.requests) == requests
+
+    assert cached.sync() is False
+
+
+def test_distribution_lookup(world_tree):
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    assert yggdrasil.get_distribution("dice") == index.Distribution(
+        "0.2.0", "/dice-0.2.0.ipk", "b"
+    )
+    assert yggdrasil.get_distribution("dice", "0.1.0") == index.Distribution(
+        "0.1.0", "/dice-0.1.0.ipk", "a"
+    )
+    assert yggdrasil.get_distribution("dice", "9.9.9") is None
+    assert yggdrasil.get_distribution("coc") is None
+    assert yggdrasil.lookup(["dice", "coc"]) == {
+        "dice": yggdrasil.get_distributions("dice"),
+        "coc": {},
+    }
+
+
+def test_sqlite_index(world_tree, monkeypatch):
+    monkeypatch.setattr(index, "INDEX_BACKEND", "sqlite")
+    world_tree.packages["packages"]["dice"]["requirements"] = [{"name": "core"}]
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    source_path = index.INDEX_PATH / "test-yggdrasil"
+    assert (source_path / "index.db").exists()
+    assert not (source_path / "packages.json").exists()
+    assert yggdrasil.packages == {}
+    distributions = yggdrasil.lookup(["dice", "coc"])
+    assert distributions["dice"]["0.1.0"].hash == "a"
+    assert distributions["coc"] == {}
+
+    assert yggdrasil.get_lastest_version("dice") == "0.2.0"
+    assert yggdrasil.get_hash("dice", "0.1.0") == "a"
+    assert yggdrasil.get_package("dice")["topics"] == ["trpg"]
+    database = yggdrasil._database
+    yggdrasil.close()
+    assert database._connection is None
+    assert yggdrasil.get_hash("dice", "0.2.0") == "b"
+
+    world_tree.packages["metadata"]["revision"] = 2
+    world_tree.deltas["1"] = {
+        "metadata": {"uuid": "test-yggdrasil", "revision": 2},
+        "packages": {"coc": {"name": "coc", "latestVersion": "1.0.0"}},
+        "removed": ["dice"],
+    }
+    assert yggdrasil.sync() is True
+    assert yggdrasil._database is database
+    assert yggdrasil.get_lastest_version("dice") is None
+    assert Yggdrasil.load(world_tree.index, "test-yggdrasil").get_package("coc")
+    assert Yggdrasil(world_tree.index, "test-yggdrasil").uuid == "test-yggdrasil"
+
+    world_tree.packages["metadata"]["revision"] = 3
+    assert yggdrasil.sync() is True
+    # 完整重新同步后旧数据库的连接被关闭
+    assert yggdrasil._database is not database
+    assert database._connection is None
+    assert yggdrasil.get_lastest_version("dice") == "0.2.0"
+
+
+def test_freshness_and_offline(world_tree):
+    world_tree.sparse = True
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    assert yggdrasil.fresh
+    yggdrasil.get_package("dice")
+
+    yggdrasil.ttl = 0
+    assert not yggdrasil.fresh
+    assert Yggdrasil(world_tree.index, "test-yggdrasil").ttl == 0
+
+    requests = len(world_tree.requests)
+    world_tree.packages["metadata"]["revision"] = 2
+    with http.offline_mode():
+        with pytest.raises(OfflineError):
+            yggdrasil.sync()
+        cached = Yggdrasil(world_tree.index, "test-yggdrasil")
+        cached._data["metadata"]["revision"] = 2
+        assert cached.get_lastest_version("dice") == "0.2.0"
+        with pytest.raises(OfflineError):
+            cached.get_package("coc")
+    assert len(world_tree.requests) == requests
+
+    yggdrasil.sync()
+    assert Yggdrasil(world_tree.index, "test-yggdrasil").ttl == 0
+
+
+def test_search_index(world_tree):
+    world_tree.packages["packages"]["coc-helper"] = {
+        "name": "coc-helper",
+        "description": "克苏鲁的呼唤规则辅助",
+        "latestVersion": "1.0.0",
+        "topics": ["trpg", "coc"],
+        "requirements": [],
+        "distributions": [],
+    }
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    assert [name for name, _ in yggdrasil.search("trpg")] == ["coc-helper", "dice"]
+    assert [name for name, _ in yggdrasil.search("COC")] == ["coc-helper"]
+    assert [name for name, _ in yggdrasil.search("规则")] == ["coc-helper", "dice"]
+    assert [name for name, _ in yggdrasil.search("克苏鲁")] == ["coc-helper"]
+    assert yggdrasil.search("dnd") == []
+
+    world_tree.packages["metadata"]["revision"] = 2
+    world_tree.deltas["1"] = {
+        "metadata": {"uuid": "test-yggdrasil", "revision": 2},
+        "packages": {"dice": {"name": "dice", "description": "掷骰", "topics": []}},
+        "removed": ["coc-helper"],
+    }
+    yggdrasil.sync()
+    assert yggdrasil.search("trpg") == []
+    assert yggdrasil.search("掷骰")[0][0] == "dice"
+
+
+class StreamingResponse(requests.Response):
+    def __init__(self, chunks) -> None:
+        super().__init__()
+        self.status_code = 200
+        self.raw = io.BytesIO()
+        self._chunks = chunks
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        return self._chunks
+
+
+def generate_index(count: int):
+    """逐个生成规则包的完整索引, 测试本身不持有整个索引"""
+    yield b'{"metadata": {"uuid": "large-yggdrasil"}, "packages": {'
+    for i in range(count):
+        package = {
+            "name": f"pkg-{i}",
+            "description": f"规则包 {i}",
+            "latestVersion": "1.0.2",
+            "topics": ["trpg"],
+            "distributions": [
+                {
+                    "version": f"1.0.{j}",
+                    "download_url": f"/pkg-{i}-{j}.ipk",
+                    "hash": "a" * 64,
+                }
+                for j in range(3)
+            ],
+        }
+        yield f'{", " if i else ""}"pkg-{i}": {json.dumps(package)}'.encode()
+    yield b"}}"
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_store_bounded_memory(world_tree, monkeypatch, backend):
+    monkeypatch.setattr(index, "INDEX_BACKEND", backend)
+    store = partial(Yggdrasil.store, world_tree.index, register=False)
+    # 预热, 排除模块导入等一次性开销
+    store(StreamingResponse(generate_index(10)))
+
+    size = sum(len(chunk) for chunk in generate_index(5000))
+    tracemalloc.start()
+    try:
+        yggdrasil = store(StreamingResponse(generate_index(5000)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # 峰值内存与索引大小无关, 同步时不构建完整的规则包字典与倒排表
+    assert peak < size // 4
+    assert yggdrasil.metadata["uuid"] == "large-yggdrasil"
+    assert yggdrasil.get_hash("pkg-4999", "1.0.1") == "a" * 64
+    assert [name for name, _ in yggdrasil.search("pkg 4999")] == ["pkg-4999"]
+
+
+def test_compressed_index(world_tree):
+    world_tree.packages["metadata"]["compressions"] = ["xz", "gz"]
+    yggdrasil = Yggdrasil.init(world_tree.index)
+    source_path = index.INDEX_PATH / "test-yggdrasil"
+    assert (source_path / "packages.json.gz").exists()
+    assert not (source_path / "packages.json").exists()
+    # 缓存的索引与其他缓存文件一样遵循 umask
+    umask = os.umask(0)
+    os.umask(umask)
+    assert (source_path / "packages.json.gz").stat().st_mode & 0o777 == 0o666 & ~umask
+    assert (
+        Yggdrasil(world_tree.index, "test-yggdrasil").get_hash("dice", "0.1.0") == "a"
+    )
+
+    world_tree.packages["packages"]["dice"]["latestVersion"] = "0.3.0"
+    assert yggdrasil.sync() is True
+    assert world_tree.requests[-1][0] == "/json/packages.json.gz"
+    assert (
+        Yggdrasil(world_tree.index, "test-yggdrasil").get_lastest_version("dice")
+        == "0.3.0"
+    )
+
+
+def test_invalid_index(world_tree):
+    world_tree.packages["metadata"] = {"revision": 1}
+    with pytest.raises(LockLoadFailed):
+        Yggdrasil.init(world_tree.index)
+    assert not list(index.INDEX_PATH.iterdir())
+
+
+def test_mirror(world_tree, tmp_path, monkeypatch, serve):
+    storage = tmp_path / "storage"
+    storage.mkdir()
+    storage.joinpath("dice-0.2.0.ipk").write_bytes(b"dice")
+    world_tree.packages["packages"]["dice"]["distributions"][1]["hash"] = (
+        hashlib.sha256(b"dice").hexdigest()
+    )
+    monkeypatch.setattr(mirror, "STORAGE", storage)
+
+    dist = tmp_path / "mirror"
+    result = mirror.snapshot(Yggdrasil.init(world_tree.index), dist)
+    assert result == (1, 1, 1)
+    assert dist.joinpath("dice-0.2.0.ipk").read_bytes() == b"dice"
+
+    index_url = serve(partial(mirror.MirrorHandler, directory=str(dist)))
+    response = requests.get(index_url + "json/packages.json")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json()["metadata"]["compressions"] == ["gz"]
+    response = requests.get(
+        index_url + "json/packages.json",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    yggdrasil = Yggdrasil.init(index_url)
+    assert yggdrasil.sync() is False
+    assert yggdrasil.get_url("dice", "0.2.0") == "/dice-0.2.0.ipk"
+    assert requests.get(index_url + "dice-0.2.0.ipk").content == b"dice"
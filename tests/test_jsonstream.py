@@ -0,0 +1,36 @@
+from ipm.utils.jsonstream import iter_items
+
+import json
+import pytest
+
+
+def chunked(content: bytes, size: int):
+    return (content[i : i + size] for i in range(0, len(content), size))
+
+
+def test_iter_items():
+    document = {
+        "packages": {
+            "dice": {"description": "骰子", "distributions": [{"version": "0.1.0"}]},
+            "coc": {"description": "克苏鲁的呼唤"},
+        },
+        "metadata": {"uuid": "test", "revision": 12345},
+        "empty": {},
+    }
+    content = json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")
+    for size in (1, 3, 7, len(content)):
+        items = list(iter_items(chunked(content, size), nested=("packages",)))
+        assert items == [
+            ("packages", "dice", document["packages"]["dice"]),
+            ("packages", "coc", document["packages"]["coc"]),
+            (None, "metadata", document["metadata"]),
+            (None, "empty", {}),
+        ]
+
+
+@pytest.mark.parametrize(
+    "content", [b"", b"[]", b'{"a": 1', b'{"a": 1,}', b'{"a": 1} {}', b'{"a" 1}']
+)
+def test_iter_items_invalid(content):
+    with pytest.raises(ValueError):
+        list(iter_items(chunked(content, 2), nested=("a",)))
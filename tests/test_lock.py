@@ -0,0 +1,108 @@
+from ipm.models.lock import PackageLock
+
+import multiprocessing
+
+
+def test_package_lock_registry(tmp_path):
+    lock = PackageLock.load(tmp_path)
+    assert PackageLock.load(tmp_path) is lock
+
+    lock.add_frozen_package("dice", "0.1.0", "a", "https://example.org/", "dice.ipk")
+    assert PackageLock.load(tmp_path) is lock
+
+    lock_path = tmp_path / "infini.lock"
+    lock_path.write_text(
+        lock_path.read_text(encoding="utf-8")
+        + '\n[[package]]\nname = "coc"\nversion = "1.0.0"\n',
+        encoding="utf-8",
+    )
+    reloaded = PackageLock.load(tmp_path)
+    assert reloaded is not lock
+    assert reloaded.has_frozen_package("coc", "1.0.0")
+
+
+def test_package_lock_lookups(tmp_path):
+    lock = PackageLock(tmp_path)
+    lock.add_frozen_package("dice", "0.1.0", "a", "https://example.org/", "dice.ipk")
+    lock.update_index("https://example.org/", "example", "/example")
+    assert lock.update_index("https://example.org/", "example", "/example") is False
+    assert lock.update_index("https://mirror.example.org/", "example", "/example")
+
+    reloaded = PackageLock(tmp_path)
+    for package_lock in (lock, reloaded):
+        assert package_lock.has_frozen_package("dice", "0.1.0")
+        assert not package_lock.has_frozen_package("dice", "0.2.0")
+        assert str(package_lock.get_frozen_package_path("dice", "0.1.0")) == "dice.ipk"
+        assert package_lock.has_index("https://mirror.example.org")
+        assert not package_lock.has_index("https://example.org/")
+
+
+def test_package_lock_transaction(tmp_path):
+    lock = PackageLock(tmp_path)
+    lock_path = tmp_path / "infini.lock"
+    with lock.transaction():
+        lock.add_frozen_package("dice", "0.1.0", "a", "https://example.org/", "a.ipk")
+        with lock.transaction():
+            lock.add_frozen_package(
+                "coc", "1.0.0", "b", "https://example.org/", "b.ipk"
+            )
+        assert not lock_path.exists()
+    assert PackageLock(tmp_path).has_frozen_package("coc", "1.0.0")
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_package_lock_lazy_document(tmp_path):
+    PackageLock(tmp_path).add_frozen_package(
+        "dice", "0.1.0", "a", "https://example.org/", "a.ipk"
+    )
+    lock = PackageLock(tmp_path)
+    assert lock.has_frozen_package("dice", "0.1.0")
+    assert lock._document is None
+
+    lock.update_index("https://example.org/", "example", "/example")
+    assert lock._document is not None
+    lock.add_frozen_package("coc", "1.0.0", "b", "https://example.org/", "b.ipk")
+
+    reloaded = PackageLock(tmp_path)
+    assert reloaded.has_index("https://example.org/")
+    assert reloaded.has_frozen_package("dice", "0.1.0")
+    assert reloaded.has_frozen_package("coc", "1.0.0")
+
+
+def add_package(source_path, name):
+    PackageLock(source_path).add_frozen_package(
+        name, "1.0.0", "a", "https://example.org/", f"{name}.ipk"
+    )
+
+
+def test_package_lock_concurrent_processes(tmp_path):
+    lock = PackageLock(tmp_path)
+    lock.has_frozen_package("dice", "1.0.0")
+
+    processes = [
+        multiprocessing.Process(target=add_package, args=(tmp_path, f"package-{i}"))
+        for i in range(8)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # 旧的实例在修改前会重新读取其他进程写入的内容
+    lock.add_frozen_package("dice", "1.0.0", "a", "https://example.org/", "dice.ipk")
+    reloaded = PackageLock(tmp_path)
+    for name in ("dice", *(f"package-{i}" for i in range(8))):
+        assert reloaded.has_frozen_package(name, "1.0.0")
+
+
+def test_package_lock_find_by_hash(tmp_path):
+    ipk_path = tmp_path / "dice-0.1.0.ipk"
+    ipk_path.write_bytes(b"dice")
+    lock = PackageLock(tmp_path)
+    lock.add_frozen_package("dice", "0.1.0", "a", "https://example.org/", str(ipk_path))
+    assert lock.find_frozen_package("dice", "0.1.0", "a") == ipk_path
+    assert lock.find_frozen_package("dice", "0.1.0", "b") is None
+    assert lock.find_frozen_package("dice", "0.1.0") == ipk_path
+
+    ipk_path.unlink()
+    assert PackageLock(tmp_path).find_frozen_package("dice", "0.1.0", "a") is None
@@ -0,0 +1,140 @@
+from ipm.exceptions import ResolutionError
+from ipm.models import lock
+from ipm.models.index import Distribution
+from ipm.utils import cache
+from ipm.utils.cache import ResolveCache
+from ipm.utils.graph import DependencyGraph
+from ipm.utils.resolve import Resolver, Term
+
+import os
+import sys
+import pytest
+
+
+class Index:
+    index = "https://example.org/"
+
+    def __init__(self, packages: dict) -> None:
+        self.packages = packages
+        self.lookups = []
+
+    def lookup(self, names: list) -> dict:
+        self.lookups.append(names)
+        return {
+            name: {
+                version: Distribution(version, f"/{name}-{version}.ipk", version)
+                for version in self.packages.get(name, {})
+            }
+            for name in names
+        }
+
+    def get_dependencies(self, name: str, version: str) -> list:
+        return [
+            {"name": dependency, "version": constraint}
+            for dependency, constraint in self.packages[name][version].items()
+        ]
+
+
+@pytest.fixture(autouse=True)
+def global_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(lock, "IPM_PATH", tmp_path)
+
+
+def resolve(packages: dict, **requirements) -> dict:
+    index = Index(packages)
+    graph = Resolver().resolve(
+        [Term(name, constraint, index) for name, constraint in requirements.items()]
+    )
+    return {name: graph.nodes[name].version for name in graph.order()}
+
+
+def test_resolve_newest_compatible():
+    packages = {
+        "coc": {"0.9.0": {"dice": ">=0.1.0,<0.3.0"}, "0.10.0": {"dice": "*"}},
+        "dice": {"0.1.0": {}, "0.2.0": {}, "0.3.0": {}},
+    }
+    assert resolve(packages, coc="*") == {"coc": "0.10.0", "dice": "0.3.0"}
+    assert resolve(packages, coc="<0.10.0") == {"coc": "0.9.0", "dice": "0.2.0"}
+
+
+def test_resolve_batch_lookup():
+    index = Index(
+        {
+            "app": {"1.0.0": {"coc": "*", "dice": "*"}},
+            "coc": {"1.0.0": {"dice": "*", "core": "*"}},
+            "dice": {"1.0.0": {"core": "*"}},
+            "core": {"1.0.0": {}},
+        }
+    )
+    graph = Resolver().resolve([Term("app", "*", index), Term("core", "*", index)])
+    assert graph.order() == ["core", "dice", "coc", "app"]
+    # 每个规则包只查询一次, 同一版本的依赖在一次调用中查询
+    assert index.lookups == [["app", "core"], ["coc", "dice"]]
+
+
+def test_resolve_backtracking():
+    packages = {
+        "a": {"2.0.0": {"c": "1.0.0"}, "1.0.0": {"c": "2.0.0"}},
+        "b": {"1.0.0": {"c": "2.0.0"}},
+        "c": {"1.0.0": {}, "2.0.0": {}},
+    }
+    assert resolve(packages, a="*", b="*") == {
+        "a": "1.0.0",
+        "b": "1.0.0",
+        "c": "2.0.0",
+    }
+
+
+def test_resolve_conflict_and_cycle():
+    packages = {
+        "a": {"1.0.0": {"b": "*", "c": "1.0.0"}},
+        "b": {"1.0.0": {"a": "*", "c": "2.0.0"}},
+        "c": {"1.0.0": {}, "2.0.0": {}},
+    }
+    with pytest.raises(ResolutionError):
+        resolve(packages, a="*")
+    packages["b"]["1.0.0"]["c"] = "*"
+    assert resolve(packages, a="*") == {"a": "1.0.0", "b": "1.0.0", "c": "1.0.0"}
+
+
+def test_resolve_cache_eviction(tmp_path):
+    resolve_cache = ResolveCache(tmp_path, max_size=250)
+    entries = [{"name": "dice", "version": "0.1.0", "hash": "a" * 64}]
+    resolve_cache.put("a", entries)
+    resolve_cache.put("b", entries)
+    os.utime(tmp_path / "a.json", (0, 0))
+    os.utime(tmp_path / "b.json", (1, 1))
+    assert resolve_cache.get("a") == entries
+
+    resolve_cache.put("c", entries)
+    assert resolve_cache.get("b") is None
+    assert resolve_cache.get("a") == resolve_cache.get("c") == entries
+
+
+def test_resolve_cache_key_format(monkeypatch):
+    inputs = {"requirements": {"dice": "0.1.0"}}
+    key = ResolveCache.key(inputs)
+    assert ResolveCache.key({"requirements": {"dice": "0.1.0"}}) == key
+    monkeypatch.setattr(cache, "RESOLVE_CACHE_FORMAT", cache.RESOLVE_CACHE_FORMAT + 1)
+    assert ResolveCache.key(inputs) != key
+
+
+def test_dependency_graph_order():
+    graph = DependencyGraph()
+    graph.add("app", None, ["coc", "dice"])
+    graph.add("coc", None, ["dice", "core"])
+    graph.add("dice", None, ["core"])
+    graph.add("core", None)
+    assert graph.order() == ["core", "dice", "coc", "app"]
+    assert graph.cycles() == []
+
+    graph.add("core", None, ["coc"])
+    assert graph.cycles() == [["coc", "dice", "core"]]
+    assert graph.order()[-1] == "app"
+
+
+def test_dependency_graph_deep_chain():
+    graph = DependencyGraph()
+    for i in range(sys.getrecursionlimit() * 2):
+        graph.add(f"p{i}", None, [f"p{i + 1}"])
+    assert graph.order()[0] == f"p{sys.getrecursionlimit() * 2 - 1}"
@@ -0,0 +1,55 @@
+from ipm.utils.version import SpecifierSet, Version, require_update
+
+import pytest
+
+
+def test_version_order():
+    versions = [
+        "0.10.0",
+        "0.9.0",
+        "1.0.0",
+        "1.0.0-rc.1",
+        "1.0.0-beta.11",
+        "1.0.0-beta.2",
+        "1.0.0-alpha",
+        "1.0.0a10",
+        "1.0.0a2",
+        "invalid",
+    ]
+    assert sorted(versions, key=Version) == [
+        "invalid",
+        "0.9.0",
+        "0.10.0",
+        "1.0.0a2",
+        "1.0.0a10",
+        "1.0.0-alpha",
+        "1.0.0-beta.2",
+        "1.0.0-beta.11",
+        "1.0.0-rc.1",
+        "1.0.0",
+    ]
+
+
+def test_version_interned():
+    assert Version("1.2.3") is Version("1.2.3")
+    assert Version("1.2") == Version("1.2.0+build")
+    assert require_update("0.9.0", "0.10.0")
+    assert not require_update("1.0.0", "1.0.0-rc.1")
+
+
+def test_specifier_set():
+    versions = ["0.1.0", "0.2.0", "0.2.5", "0.3.0-rc.1", "0.3.0", "1.0.0", "1.4.2"]
+    assert SpecifierSet(">=0.2.0,<0.3.0").filter(versions) == ["0.2.0", "0.2.5"]
+    assert SpecifierSet("~=0.2.1").best(versions) == "0.2.5"
+    assert SpecifierSet("~=1.0").best(versions) == "1.4.2"
+    assert SpecifierSet("^0.2.0").best(versions) == "0.2.5"
+    assert SpecifierSet("^1.0.0").best(versions) == "1.4.2"
+    assert SpecifierSet("!=1.4.2").best(versions) == "1.0.0"
+    assert SpecifierSet("*").best(versions) == "1.4.2"
+    assert SpecifierSet("0.1.0").exact == "0.1.0"
+    assert SpecifierSet(">2.0.0").best(versions) is None
+    assert SpecifierSet(">=0.1.0") is SpecifierSet(">=0.1.0")
+    with pytest.raises(ValueError):
+        SpecifierSet(">=0.1.0;")
+    with pytest.raises(ValueError):
+        SpecifierSet("=>0.1.0")